@@ -0,0 +1,68 @@
+"""Chunk splitting and waveform compilation benchmark.
+
+Splits sequences into chunks with pittld.driver.split and compiles the
+first chunks into pigpio pulses with compile_chunk, timing both per
+chunk and per pulse. Run from the repository root with
+
+    PYTHONPATH=src python3 bench/chunks.py
+"""
+import argparse
+import statistics
+import time
+
+from pittld.driver import compile_chunk, split
+from pittld.sequence import SeededSequence, random_sequence
+
+
+SEQUENCES = {
+    'random': lambda n, m: random_sequence(n, m, 0),
+    'seeded': lambda n, m: SeededSequence(n, m, 0),
+}
+
+
+def run(n, frac, res, kinds=tuple(SEQUENCES), chunks=8):
+    results = []
+    for kind in kinds:
+        seq = SEQUENCES[kind](n, round(n * frac))
+
+        t0 = time.perf_counter()
+        chain = split(seq, res)
+        split_s = time.perf_counter() - t0
+
+        samples = []
+        pulses = 0
+        for i in range(min(chunks, len(chain))):
+            t0 = time.perf_counter()
+            wf = compile_chunk(chain[i], res)[0]
+            samples.append(time.perf_counter() - t0)
+            pulses += len(wf)
+
+        results.append({'kind': kind, 'n': n, 'resolution': res,
+                        'chunks': len(chain),
+                        'split_s': split_s,
+                        'split_per_chunk_s': split_s / len(chain),
+                        'compiled': len(samples),
+                        'compile_mean_s': statistics.mean(samples),
+                        'compile_max_s': max(samples),
+                        'compile_per_pulse_us':
+                            sum(samples) * 1e6 / pulses if pulses else None})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--n', type=int, default=10 ** 7)
+    parser.add_argument('--frac', type=float, default=0.3)
+    parser.add_argument('--res', type=float, default=0.01)
+    parser.add_argument('--chunks', type=int, default=8,
+                        help='chunks to compile per sequence')
+    args = parser.parse_args()
+
+    for r in run(args.n, args.frac, args.res, chunks=args.chunks):
+        print('{kind:>7} {n:>11} slots  {chunks:6} chunks  '
+              'split {split_s:8.3f}s  compile {compile_mean_s:8.4f}s/chunk '
+              '{compile_per_pulse_us:6.2f}us/pulse'.format(**r))
+
+
+if __name__ == '__main__':
+    main()
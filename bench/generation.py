@@ -0,0 +1,66 @@
+"""Sequence generation throughput and memory benchmark.
+
+Times pittld.sequence.random_sequence and regular_sequence for growing
+sequence lengths and records the peak memory traced while generating
+each. Run from the repository root with
+
+    PYTHONPATH=src python3 bench/generation.py
+"""
+import argparse
+import time
+import tracemalloc
+
+from pittld.sequence import random_sequence, regular_sequence
+
+
+GENERATORS = {
+    'random': lambda n, m: random_sequence(n, m, 0),
+    'regular': regular_sequence,
+}
+
+
+def measure(fcn, n, m):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    seq = fcn(n, m)
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del seq
+    return {'seconds': elapsed,
+            'slots_per_s': n / elapsed if elapsed else None,
+            'peak_mb': peak / 1e6,
+            'bytes_per_slot': peak / n}
+
+
+def run(sizes, frac, kinds=tuple(GENERATORS)):
+    # Warm up numpy before timing anything
+    random_sequence(8, 1, 0)
+
+    results = []
+    for kind in kinds:
+        for n in sizes:
+            m = round(n * frac)
+            r = {'kind': kind, 'n': n, 'm': m}
+            r.update(measure(GENERATORS[kind], n, m))
+            results.append(r)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10 ** k for k in range(4, 9)])
+    parser.add_argument('--frac', type=float, default=0.3)
+    parser.add_argument('--kinds', nargs='+', choices=list(GENERATORS),
+                        default=list(GENERATORS))
+    args = parser.parse_args()
+
+    for r in run(args.sizes, args.frac, args.kinds):
+        print('{kind:>7} {n:>11} slots  {seconds:9.4f}s  '
+              '{slots_per_s:12.4g} slots/s  peak {peak_mb:9.1f}MB'
+              .format(**r))
+
+
+if __name__ == '__main__':
+    main()
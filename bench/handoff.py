@@ -0,0 +1,90 @@
+"""Driver chunk handoff benchmark.
+
+Plays a chunked program through the driver on a simulated pigpio daemon
+and reports, per handoff from one chunk to the next, the real time the
+driver spent and how far ahead of the playing chunk's end the next one
+was queued, along with any gaps between chunks. Run from the
+repository root with
+
+    PYTHONPATH=src python3 bench/handoff.py
+"""
+import argparse
+import logging
+import statistics
+from threading import Event
+import time
+
+from pittld import logger
+from pittld.backend import SimulatedPi
+import pittld.driver
+
+
+def play(pi, total, frac, res, kind='seeded', seed=0):
+    # Play a program to its end, returning the driver and the real
+    # seconds it took
+    driver = pittld.driver.Service(None, pi)
+    done = Event()
+    driver.bus.subscribe(
+        lambda event, data: event in ('finish', 'error') and done.set())
+
+    driver.stage_timing((total, frac, res))
+    job = driver.submit_stage(kind, seed)
+    while not job.done:
+        time.sleep(0.01)
+
+    t0 = time.perf_counter()
+    driver.start()
+    driver.start_seq()
+    done.wait()
+    elapsed = time.perf_counter() - t0
+    driver.kill()
+    driver.join()
+    return driver, elapsed
+
+
+def run(total, frac, res, kind='seeded', seed=0, **latencies):
+    pi = SimulatedPi(**latencies)
+    driver, elapsed = play(pi, total, frac, res, kind, seed)
+
+    handoffs = max(len(pi.transmissions) - 1, 1)
+    leads = [x / 1e3 for x in pi.leads()] or [0.0]
+    gaps = pi.gaps() or [0]
+    drift = driver.drift_stats()
+    return {'total': total, 'resolution': res, 'kind': kind,
+            'chunks': len(pi.transmissions),
+            'seconds': elapsed,
+            'per_handoff_ms': elapsed * 1e3 / handoffs,
+            'lead_min_ms': min(leads),
+            'lead_median_ms': statistics.median(leads),
+            'max_gap_us': max(gaps),
+            'mean_gap_us': statistics.mean(gaps),
+            'late': sum(x > 0 for x in gaps),
+            'drift_us': drift['drift'],
+            'measured_over_scheduled_us':
+                drift['measured'] - drift['scheduled'],
+            'cost_us_per_pulse': driver.cost,
+            'latencies_us': {'create': pi.create_latency,
+                             'pulse': pi.pulse_latency,
+                             'tx': pi.tx_latency}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--total', type=float, default=86400)
+    parser.add_argument('--frac', type=float, default=0.3)
+    parser.add_argument('--res', type=float, default=0.1)
+    parser.add_argument('--kind', choices=('random', 'seeded'),
+                        default='seeded')
+    args = parser.parse_args()
+    logger.setLevel(logging.WARNING)
+
+    r = run(args.total, args.frac, args.res, args.kind)
+    print('{chunks} chunks in {seconds:.2f}s, {per_handoff_ms:.2f}ms '
+          'per handoff'.format(**r))
+    print('queued {lead_min_ms:.1f}ms (min) {lead_median_ms:.1f}ms '
+          '(median) ahead, {late} late, max gap {max_gap_us}us, '
+          'drift {drift_us}us'.format(**r))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""Manager per-request benchmark.
+
+Measures the latency and throughput of every Request type over loopback
+with the framed protocol, against a manager serving a driver on a
+simulated pigpio daemon. The driver's run loop is not started, so a
+started program stays on its first chunk and every request sees the
+same state. Whatever a request needs (a running program, a queued
+program, a job to cancel) is set up before each request, untimed. Run
+from the repository root with
+
+    PYTHONPATH=src python3 bench/manager.py
+"""
+import argparse
+from itertools import count
+import logging
+import shutil
+import socket
+import statistics
+import tempfile
+import time
+
+from pittld import logger
+from pittld import protocol
+from pittld.backend import SimulatedPi
+import pittld.driver
+import pittld.manager
+from pittld.shared import Request, Response
+from pittld.store import COMMITTED
+
+
+TIMING = (600, 0.3, 0.01)
+
+
+class Client:
+
+    def __init__(self, addr):
+        self.sock = socket.create_connection(addr)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._rids = count(1)
+
+    def call(self, msg, data=None):
+        # The final response to a request, after any STREAM frames and
+        # events in between
+        rid = next(self._rids)
+        protocol.send_message(self.sock, rid, msg, data)
+        while True:
+            got, rsp, payload = protocol.recv_message(self.sock)
+            if got == rid and rsp not in (Response.STREAM, Response.EVENT):
+                return rsp, payload
+
+    def close(self):
+        self.sock.close()
+
+
+class Bench:
+    # A driver and manager, and how to put them in the state each
+    # request expects
+
+    def __init__(self):
+        self.store = tempfile.mkdtemp(prefix='pittld-bench-')
+        self.driver = pittld.driver.Service(None, SimulatedPi())
+        self.driver.attach_store(self.store)
+        self.manager = pittld.manager.Service(self.driver, host='127.0.0.1',
+                                              port=0)
+        self.manager.daemon = True
+        self.manager.start()
+        while self.manager.address is None:
+            time.sleep(0.01)
+        self.client = Client(self.manager.address)
+        self.checkpoint = None
+
+    def reset(self):
+        d = self.driver
+        d.stop_seq()
+        d.dequeue()
+        d.clear_channel()
+        d.stage_timing(TIMING)
+        d.stage_seq_seeded(0)
+
+    def started(self):
+        self.driver.stop_seq()
+        self.driver.start_seq()
+
+    def stopped(self):
+        self.driver.stop_seq()
+
+    def resumable(self):
+        # A checkpoint of a running program, as left by a restart
+        d = self.driver
+        if self.checkpoint is None:
+            self.started()
+            d._checkpoint(force=True)
+            self.checkpoint = (d.store.load(COMMITTED),
+                               d.store.load_bounds(COMMITTED).copy())
+        d.stop_seq()
+        meta, bounds = self.checkpoint
+        d.store.save(COMMITTED, meta)
+        d.store.save_bounds(COMMITTED, bounds)
+        d.attach_store(self.store)
+
+    def queued(self, n=1):
+        self.driver.dequeue()
+        return [self.driver.enqueue().id for _ in range(n)]
+
+    def subscribed(self):
+        self.client.call(Request.SUBSCRIBE)
+
+    def unsubscribed(self):
+        self.client.call(Request.UNSUBSCRIBE)
+
+    def job(self):
+        return self.driver.submit_stage('random', 0, (3600, 0.3, 0.001)).id
+
+    def channel(self):
+        self.driver.stage_channel(19)
+
+
+# (request, payload or a function of the setup's result, setup run before
+# every request)
+CASES = [
+    (Request.STAGE_TIMING, TIMING, None),
+    (Request.STAGE_SEQUENCE_RANDOM, 0, None),
+    (Request.STAGE_SEQUENCE_SEEDED, 0, None),
+    (Request.STAGE_SEQUENCE_REGULAR, None, None),
+    (Request.QUERY_TIMING, None, None),
+    (Request.QUERY_SEQUENCE, None, None),
+    (Request.QUERY_PROGRAM, None, None),
+    (Request.QUERY_RANGE, {'start': 0, 'stop': 1000}, None),
+    (Request.QUERY_SUMMARY, None, None),
+    (Request.START_SEQUENCE, None, Bench.stopped),
+    (Request.QUERY_CHUNK, None, Bench.started),
+    (Request.STOP_SEQUENCE, None, Bench.started),
+    (Request.RESUME_SEQUENCE, None, Bench.resumable),
+    (Request.SUBSCRIBE, None, Bench.unsubscribed),
+    (Request.UNSUBSCRIBE, None, Bench.subscribed),
+    (Request.STAGE_JOB, {'kind': 'seeded', 'seed': 0}, None),
+    (Request.QUERY_JOB, None, None),
+    (Request.CANCEL_JOB, lambda job: job, Bench.job),
+    (Request.ENQUEUE, None, None),
+    (Request.QUERY_QUEUE, None, lambda b: b.queued(4)),
+    (Request.DEQUEUE, lambda ids: ids[0], Bench.queued),
+    (Request.MOVE_QUEUE, lambda ids: (ids[0], 1), lambda b: b.queued(2)),
+    (Request.STAGE_CHANNEL, 19, None),
+    (Request.CLEAR_CHANNEL, 19, Bench.channel),
+    (Request.QUERY_CHANNELS, None, Bench.channel),
+    (Request.QUERY_METRICS, None, None),
+]
+
+
+def measure(bench, msg, data, setup, n):
+    bench.reset()
+    samples = []
+    failures = 0
+    for _ in range(n):
+        state = setup(bench) if setup is not None else None
+        payload = data(state) if callable(data) else data
+        t0 = time.perf_counter()
+        rsp, _ = bench.client.call(msg, payload)
+        samples.append(time.perf_counter() - t0)
+        failures += rsp == Response.FAILURE
+    samples.sort()
+    return {'request': msg.name,
+            'n': n,
+            'failures': failures,
+            'mean_us': statistics.mean(samples) * 1e6,
+            'p50_us': samples[len(samples) // 2] * 1e6,
+            'p99_us': samples[int(len(samples) * 0.99)] * 1e6,
+            'rps': n / sum(samples)}
+
+
+def run(n, requests=None):
+    bench = Bench()
+    results = []
+    try:
+        for msg, data, setup in CASES:
+            if requests is None or msg.name in requests:
+                results.append(measure(bench, msg, data, setup, n))
+    finally:
+        bench.client.close()
+        bench.reset()
+        bench.driver.kill()
+        shutil.rmtree(bench.store, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', type=int, default=200,
+                        help='requests of each type')
+    parser.add_argument('--requests', nargs='+', metavar='REQUEST',
+                        choices=[msg.name for msg, _, _ in CASES])
+    args = parser.parse_args()
+    logger.setLevel(logging.WARNING)
+
+    for r in run(args.n, args.requests):
+        print('{request:>24}  mean {mean_us:9.1f}us  p50 {p50_us:9.1f}us  '
+              'p99 {p99_us:9.1f}us  {rps:8.0f} req/s  '
+              '{failures} failed'.format(**r))
+
+
+if __name__ == '__main__':
+    main()
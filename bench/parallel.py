@@ -0,0 +1,52 @@
+"""Parallel random sequence generation benchmark.
+
+Times pittld.sequence.random_sequence with 1 to 4 worker processes and
+checks every worker count yields the same sequence. Run from the
+repository root with
+
+    PYTHONPATH=src python3 bench/parallel.py
+"""
+import argparse
+import time
+
+from pittld.sequence import random_sequence, summarize
+
+
+def timed(fcn, *args, **kwargs):
+    t0 = time.perf_counter()
+    out = fcn(*args, **kwargs)
+    return time.perf_counter() - t0, out
+
+
+def run(n, frac, workers, seed=0):
+    m = round(n * frac)
+    results = []
+    for w in workers:
+        # The first call per worker count starts its pool
+        random_sequence(1 << 24, 1 << 20, seed, workers=w)
+        elapsed, seq = timed(random_sequence, n, m, seed, workers=w)
+        results.append({'n': n, 'm': m, 'workers': w, 'seconds': elapsed,
+                        'hash': summarize(seq)['hash']})
+        del seq
+
+    base = results[0]['seconds']
+    for r in results:
+        r['speedup'] = base / r['seconds']
+        r['identical'] = r['hash'] == results[0]['hash']
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--n', type=int, default=2 * 10 ** 8)
+    parser.add_argument('--frac', type=float, default=0.3)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 3, 4])
+    args = parser.parse_args()
+
+    for r in run(args.n, args.frac, args.workers):
+        print('{n:>11} slots  {workers} worker(s) {seconds:9.4f}s  '
+              'x{speedup:.2f}  identical={identical}'.format(**r))
+
+
+if __name__ == '__main__':
+    main()
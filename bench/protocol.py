@@ -0,0 +1,112 @@
+"""Manager wire protocol benchmark.
+
+Measures request latency and throughput over loopback for the framed
+protocol and the legacy pickle protocol, against a manager serving a
+driver with staged timing. Run from the repository root with
+
+    PYTHONPATH=src python3 bench/protocol.py
+"""
+import argparse
+import logging
+import pickle
+import socket
+import statistics
+import time
+
+from pittld import logger
+from pittld import protocol
+from pittld.backend import SimulatedPi
+import pittld.driver
+import pittld.manager
+from pittld.shared import Request
+
+
+def start_manager():
+    driver = pittld.driver.Service(None, SimulatedPi())
+    driver.stage_timing((3600, 0.3, 0.01))
+    svc = pittld.manager.Service(driver, host='127.0.0.1', port=0,
+                                 legacy=True)
+    svc.daemon = True
+    svc.start()
+    while svc.address is None:
+        time.sleep(0.01)
+    return svc.address
+
+
+def pickle_request(sock, msg):
+    sock.sendall(pickle.dumps((msg, None)))
+    return pickle.loads(sock.recv(1 << 16))
+
+
+def framed_request(sock, msg):
+    protocol.send_message(sock, 0, msg)
+    return protocol.recv_message(sock)
+
+
+def latency(addr, request, n):
+    samples = []
+    with socket.create_connection(addr) as sock:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        for _ in range(n):
+            t0 = time.perf_counter()
+            request(sock, Request.QUERY_TIMING)
+            samples.append(time.perf_counter() - t0)
+    samples.sort()
+    return {'mean_us': statistics.mean(samples) * 1e6,
+            'p50_us': samples[len(samples) // 2] * 1e6,
+            'p99_us': samples[int(len(samples) * 0.99)] * 1e6}
+
+
+def pipelined_throughput(addr, n, window):
+    with socket.create_connection(addr) as sock:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        t0 = time.perf_counter()
+        sent = received = 0
+        while received < n:
+            while sent < n and sent - received < window:
+                protocol.send_message(sock, sent, Request.QUERY_TIMING)
+                sent += 1
+            protocol.recv_message(sock)
+            received += 1
+        return n / (time.perf_counter() - t0)
+
+
+def sequential_throughput(addr, request, n):
+    with socket.create_connection(addr) as sock:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        t0 = time.perf_counter()
+        for _ in range(n):
+            request(sock, Request.QUERY_TIMING)
+        return n / (time.perf_counter() - t0)
+
+
+def run(n, window):
+    addr = start_manager()
+    return {
+        'pickle': {'latency': latency(addr, pickle_request, n),
+                   'rps': sequential_throughput(addr, pickle_request, n)},
+        'framed': {'latency': latency(addr, framed_request, n),
+                   'rps': sequential_throughput(addr, framed_request, n),
+                   'pipelined_rps': pipelined_throughput(addr, n, window)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', type=int, default=2000)
+    parser.add_argument('--window', type=int, default=32,
+                        help='requests in flight when pipelining')
+    args = parser.parse_args()
+    logger.setLevel(logging.WARNING)
+
+    for name, r in run(args.n, args.window).items():
+        line = '{:>7}  mean {mean_us:7.1f}us  p50 {p50_us:7.1f}us  ' \
+               'p99 {p99_us:7.1f}us'.format(name, **r['latency'])
+        line += '  {:8.0f} req/s'.format(r['rps'])
+        if 'pipelined_rps' in r:
+            line += '  pipelined {:8.0f} req/s'.format(r['pipelined_rps'])
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
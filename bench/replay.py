@@ -0,0 +1,90 @@
+"""Simulated program replay.
+
+Plays a whole program through the driver on a simulated pigpio daemon
+with a virtual clock, then checks the time the output pin was held ON
+against the sequence, the gaps between waves, and the first pulses
+against the sequence slot by slot. Run from the repository root with
+
+    PYTHONPATH=src python3 bench/replay.py
+"""
+import argparse
+from itertools import islice
+import logging
+from threading import Event
+import time
+
+from pittld import logger
+from pittld.backend import SimulatedPi
+import pittld.driver
+
+
+def matches(seq, run, first, micros):
+    # Whether a run the pin went through is a run of whole slots of seq
+    start, level, length = run
+    if (start - first) % micros or length % micros:
+        return False
+    i = (start - first) // micros
+    return bool((seq[i:i + length // micros].unpack() == level).all())
+
+
+def run(days, frac, res, kind='seeded', seed=0, check=1000):
+    pi = SimulatedPi()
+    driver = pittld.driver.Service(None, pi)
+    done = Event()
+    driver.bus.subscribe(
+        lambda event, data: event in ('finish', 'error') and done.set())
+
+    driver.stage_timing((days * 86400, frac, res))
+    driver.submit_stage(kind, seed)
+    while driver.jobs()[-1].state in ('pending', 'running'):
+        time.sleep(0.01)
+    seq = driver.staged_seq
+    on = driver.staged_stats['on']
+
+    t0 = time.perf_counter()
+    v0 = pi.clock.time()
+    driver.start()
+    driver.start_seq()
+    done.wait()
+    elapsed = time.perf_counter() - t0
+    driver.kill()
+    driver.join()
+
+    micros = int(res * pittld.driver.MICROS)
+    low, high = pi.held(pittld.driver.PIN)
+    first = pi.transmissions[0].start
+    runs = islice(pi.trace(pittld.driver.PIN), check)
+    matched = all(matches(seq, x, first, micros) for x in runs)
+
+    gaps = pi.gaps()
+    return {'days': days, 'resolution': res, 'kind': kind,
+            'seconds': elapsed,
+            'virtual_days': (pi.clock.time() - v0) / 86400,
+            'waves': len(pi.transmissions),
+            'on_micros': low, 'expected_on_micros': on * micros,
+            'exposure_ok': low == on * micros,
+            'max_gap': max(gaps) if gaps else 0,
+            'pulses_ok': matched}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--days', type=float, default=30)
+    parser.add_argument('--frac', type=float, default=0.3)
+    parser.add_argument('--res', type=float, default=1.0)
+    parser.add_argument('--kind', choices=pittld.driver.SEQUENCE_KINDS,
+                        default='seeded')
+    args = parser.parse_args()
+    logger.setLevel(logging.WARNING)
+
+    r = run(args.days, args.frac, args.res, args.kind)
+    print('{days:g} days at {resolution:g}s ({kind}) replayed in '
+          '{seconds:.2f}s ({virtual_days:.3f} virtual days, {waves} waves)'
+          .format(**r))
+    print('ON {on_micros}us, expected {expected_on_micros}us: '
+          'exposure_ok={exposure_ok}'.format(**r))
+    print('max gap {max_gap}us, pulses_ok={pulses_ok}'.format(**r))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Random sequence generation benchmark.
+
+Compares the vectorized sampler in pittld.sequence against the pure-Python
+Knuth shuffle it replaced. Run from the repository root with
+
+    PYTHONPATH=src python3 bench/sequence.py
+"""
+import argparse
+import random
+import time
+
+from pittld.sequence import OFF, ON, random_sequence
+
+
+def knuth_sequence(n, m):
+    head = [ON] * m
+    tail = [OFF] * (n - m)
+    seq = head + tail
+
+    for i in range(n - 1):
+        j = random.randint(i, n - 1)
+        a = seq[i]
+        seq[i] = seq[j]
+        seq[j] = a
+
+    return seq
+
+
+def timed(fcn, *args):
+    t0 = time.perf_counter()
+    fcn(*args)
+    return time.perf_counter() - t0
+
+
+def run(sizes, frac, knuth_max):
+    # Warm up numpy before timing anything
+    random_sequence(8, 1, 0)
+
+    results = []
+    for n in sizes:
+        m = round(n * frac)
+        r = {'n': n, 'm': m, 'vectorized_s': timed(random_sequence, n, m, 0)}
+        if n <= knuth_max:
+            r['knuth_s'] = timed(knuth_sequence, n, m)
+            r['speedup'] = r['knuth_s'] / r['vectorized_s']
+        results.append(r)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10 ** k for k in range(4, 9)])
+    parser.add_argument('--frac', type=float, default=0.3)
+    parser.add_argument('--knuth-max', type=int, default=10 ** 6,
+                        help='largest n to run the Knuth shuffle for')
+    args = parser.parse_args()
+
+    for r in run(args.sizes, args.frac, args.knuth_max):
+        line = '{n:>11} slots  vectorized {vectorized_s:9.4f}s'.format(**r)
+        if 'knuth_s' in r:
+            line += '  knuth {knuth_s:9.4f}s  x{speedup:.1f}'.format(**r)
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
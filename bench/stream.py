@@ -0,0 +1,105 @@
+"""QUERY_SEQUENCE streaming benchmark.
+
+Measures transfer time and peak traced memory (manager and client share
+the process, so the peak covers both) for the legacy pickled lists and
+for the framed bit-packed stream, raw and compressed, over loopback. Run
+from the repository root with
+
+    PYTHONPATH=src python3 bench/stream.py
+"""
+import argparse
+import logging
+import pickle
+import socket
+import time
+import tracemalloc
+
+from pittld import logger
+from pittld import protocol
+from pittld.backend import SimulatedPi
+import pittld.driver
+import pittld.manager
+from pittld.shared import Request, Response
+
+
+def start_manager(n, frac):
+    # A manager serving a staged random sequence of n slots
+    driver = pittld.driver.Service(None, SimulatedPi())
+    driver.stage_timing((n, frac, 1))
+    driver.stage_seq_rand(0)
+    svc = pittld.manager.Service(driver, host='127.0.0.1', port=0,
+                                 legacy=True)
+    svc.daemon = True
+    svc.start()
+    while svc.address is None:
+        time.sleep(0.01)
+    return svc.address
+
+
+def legacy_query(addr):
+    with socket.create_connection(addr) as sock, sock.makefile('rb') as f:
+        sock.sendall(pickle.dumps((Request.QUERY_SEQUENCE, None)))
+        pickle.load(f)
+        body = pickle.load(f)
+        pickle.load(f)
+    return len(body['sequence']['staged'])
+
+
+def framed_query(addr, compression):
+    received = 0
+    with socket.create_connection(addr) as sock:
+        protocol.send_message(sock, 1, Request.QUERY_SEQUENCE,
+                              {'compression': compression})
+        while True:
+            _, msg, data = protocol.recv_message(sock)
+            if msg != Response.STREAM:
+                break
+            if isinstance(data, bytes):
+                received += len(data)
+    return received
+
+
+def measure(fcn, *args):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    nbytes = fcn(*args)
+    elapsed = time.perf_counter() - t0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': elapsed, 'peak_mb': peak / 1e6, 'received': nbytes}
+
+
+def run(sizes, frac, legacy_max):
+    results = []
+    for n in sizes:
+        addr = start_manager(n, frac)
+        r = {'n': n}
+        if n <= legacy_max:
+            r['legacy'] = measure(legacy_query, addr)
+        for compression in None, 'zlib':
+            r[compression or 'packed'] = measure(framed_query, addr,
+                                                 compression)
+        results.append(r)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10 ** 5, 10 ** 6, 10 ** 7, 10 ** 8])
+    parser.add_argument('--frac', type=float, default=0.3)
+    parser.add_argument('--legacy-max', type=int, default=10 ** 7,
+                        help='largest n to run the legacy path for')
+    args = parser.parse_args()
+    logger.setLevel(logging.WARNING)
+
+    for r in run(args.sizes, args.frac, args.legacy_max):
+        for name in 'legacy', 'packed', 'zlib':
+            if name in r:
+                print('{:>11} slots  {:>6}  {seconds:8.3f}s  '
+                      'peak {peak_mb:9.1f}MB'.format(r['n'], name,
+                                                     **r[name]))
+
+
+if __name__ == '__main__':
+    main()
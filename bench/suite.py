@@ -0,0 +1,98 @@
+"""Benchmark suite.
+
+Runs the generation, chunk compilation, handoff, manager request and
+protocol benchmarks against a simulated pigpio daemon and writes their
+results, with a description of the machine and tree they ran on, as one
+JSON document. Run from the repository root with
+
+    PYTHONPATH=src python3 bench/suite.py --out results.json
+
+and compare documents from different releases to track the hot paths.
+"""
+import argparse
+from datetime import datetime, timezone
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import pittld
+from pittld import logger
+
+import chunks
+import generation
+import handoff
+import manager
+import protocol
+
+
+# Benchmarks by name: the function running one and its arguments, at
+# sizes that keep the whole suite short enough to run for every release
+BENCHMARKS = {
+    'generation': (generation.run,
+                   {'sizes': [10 ** k for k in range(4, 9)], 'frac': 0.3}),
+    'chunks': (chunks.run, {'n': 10 ** 7, 'frac': 0.3, 'res': 0.01}),
+    'handoff': (handoff.run, {'total': 86400, 'frac': 0.3, 'res': 0.1}),
+    'manager': (manager.run, {'n': 200}),
+    'protocol': (protocol.run, {'n': 2000, 'window': 32}),
+}
+
+
+def revision():
+    # The git commit benchmarked, if there is one
+    try:
+        out = subprocess.run(['git', 'rev-parse', 'HEAD'],
+                             capture_output=True, text=True, timeout=10,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def environment():
+    return {'pittld': pittld.__version__,
+            'revision': revision(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'date': datetime.now(timezone.utc).isoformat()}
+
+
+def run(names=tuple(BENCHMARKS)):
+    results = {'environment': environment(), 'benchmarks': {}}
+    for name in names:
+        fcn, kwargs = BENCHMARKS[name]
+        t0 = time.perf_counter()
+        results['benchmarks'][name] = {'parameters': kwargs,
+                                       'results': fcn(**kwargs),
+                                       'seconds': time.perf_counter() - t0}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--only', nargs='+', choices=list(BENCHMARKS),
+                        default=list(BENCHMARKS))
+    parser.add_argument('--out', metavar='FILE',
+                        help='write the results to FILE instead of stdout')
+    args = parser.parse_args()
+    logger.setLevel(logging.WARNING)
+
+    results = run(args.only)
+    if args.out is None:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
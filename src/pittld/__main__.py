@@ -2,28 +2,60 @@ import argparse
 
 import pittld
 from pittld import logger
+from pittld.backend import connect
 import pittld.driver
-import pittld.inet
-import pittld.lcd
 import pittld.manager
 import pittld.svc as svc
 
 
-# Stage services and their mutually assured destruction
-lcd = pittld.lcd.Service()
-inet = pittld.inet.Service(lcd)
-driver = pittld.driver.Service(lcd)
-manager = pittld.manager.Service(driver)
-svc.associate([lcd, inet, driver, manager])
-
-
 def main():
+    parser = argparse.ArgumentParser(prog='pittld')
+    parser.add_argument('--legacy-pickle', action='store_true',
+                        help='accept clients using the legacy pickle '
+                             'protocol, which lets them run code on the Pi')
+    parser.add_argument('--store', metavar='DIR',
+                        help='keep programs in memory-mapped files in DIR')
+    parser.add_argument('--resume', action='store_true',
+                        help='resume a program interrupted by a restart '
+                             '(requires --store)')
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help='serve metrics in the Prometheus text format '
+                             'on localhost:PORT')
+    parser.add_argument('--simulate', action='store_true',
+                        help='play programs on a simulated pigpio daemon '
+                             'with a virtual clock, without the LCD and '
+                             'connectivity monitor')
+    args = parser.parse_args()
+
+    # Stage services and their mutually assured destruction
+    pi = connect(simulate=args.simulate)
+    if args.simulate:
+        lcd = None
+        services = []
+    else:
+        # Imported here, as they need libraries only a Pi has
+        from pittld.inet import Service as InetService
+        from pittld.lcd import Service as LcdService
+        lcd = LcdService(pi)
+        services = [lcd, InetService(lcd)]
+    driver = pittld.driver.Service(lcd, pi)
+    manager = pittld.manager.Service(driver, legacy=args.legacy_pickle,
+                                     metrics_port=args.metrics_port)
+    services += [driver, manager]
+    svc.associate(services)
+
+    if args.store is not None:
+        driver.attach_store(args.store)
+    if args.resume and driver.resumable() is not None:
+        try:
+            driver.resume_seq()
+        except pittld.driver.DriverException as e:
+            logger.error('Could not resume program: {}'.format(e))
+
     logger.info('Starting pittld {}'.format(pittld.__version__))
 
-    lcd.start()
-    inet.start()
-    driver.start()
-    manager.start()
+    for service in services:
+        service.start()
 
 
 if __name__ == '__main__':
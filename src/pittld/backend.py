@@ -0,0 +1,583 @@
+import math
+import time
+
+import numpy as np
+import pigpio
+
+
+# Constants
+# Real seconds a virtual wait lets other threads in before time jumps
+GRACE = 1e-4
+
+# pigpio's defaults for a daemon's wave resources
+SIM_MAX_PULSES = 12000
+SIM_MAX_CBS = 25016
+SIM_MAX_MICROS = 30 * 60 * 1000000
+SIM_MAX_WAVES = 250
+SIM_CBS_PER_PULSE = 3
+
+# Modelled latencies in micros: creating a wave, per wave and per pulse,
+# and from a send command to the first pulse going out
+CREATE_LATENCY = 200
+PULSE_LATENCY = 5
+TX_LATENCY = 100
+
+# GPIO pins wired to the LCD, and all the pins other services drive,
+# which programs may not
+LCD_RS = 15
+LCD_RW = 18
+LCD_E = 16
+LCD_DATA = (21, 22, 23, 24)
+LCD_CONTRAST = 17
+RESERVED_PINS = frozenset((LCD_RS, LCD_RW, LCD_E, LCD_CONTRAST) + LCD_DATA)
+
+# Chain commands
+CHAIN_ESCAPE = 255
+LOOP_START = 0
+LOOP_END = 1
+CHAIN_DELAY = 2
+
+
+# Clocks
+class Clock:
+    # The wall clock a pigpio daemon runs on
+
+    def time(self):
+        return time.time()
+
+    def perf_counter(self):
+        return time.perf_counter()
+
+    def wait(self, cond, timeout, idle=None):
+        # Wait on cond for timeout seconds of this clock, or idle seconds
+        # of real time if that is sooner. Returns whether cond was
+        # notified.
+        if timeout is None:
+            return cond.wait(idle)
+        if idle is not None:
+            timeout = min(timeout, idle)
+        return cond.wait(timeout)
+
+
+class VirtualClock(Clock):
+    # A clock that only moves when told to. A wait that nobody notifies
+    # within GRACE of real time jumps the clock to its end, so a program
+    # plays out as fast as the code driving it runs. Time is kept in
+    # whole micros, like pigpio's ticks.
+
+    def __init__(self, start=None):
+        if start is None:
+            start = time.time()
+        self.micros = int(start * 1000000)
+
+    def time(self):
+        return self.micros / 1000000
+
+    def perf_counter(self):
+        return self.time()
+
+    def advance(self, seconds):
+        self.micros += max(math.ceil(seconds * 1000000), 0)
+
+    def wait(self, cond, timeout, idle=None):
+        if timeout is None:
+            # Nothing is due, so wait for real
+            return cond.wait(idle)
+        if cond.wait(GRACE):
+            return True
+        self.advance(timeout)
+        return False
+
+
+WALL_CLOCK = Clock()
+
+
+# Backends
+def connect(simulate=False, **kwargs):
+    # A pigpio client: one connected to pigpiod, or a simulated daemon
+    if simulate:
+        return SimulatedPi(**kwargs)
+    pi = pigpio.pi(**kwargs)
+    if not pi.connected:
+        raise pigpio.error('Could not connect to pigpiod')
+    return pi
+
+
+def clock_of(pi):
+    # The clock a client's waves play out on
+    return getattr(pi, 'clock', WALL_CLOCK)
+
+
+# Simulation
+def _then(a, b):
+    # Level summary of a segment followed by another. A summary maps the
+    # level a pin enters a segment at to the micros it then spends low
+    # and high, and the level it leaves at.
+    out = {}
+    for x in 0, 1:
+        low, high, y = a[x]
+        blow, bhigh, z = b[y]
+        out[x] = (low + blow, high + bhigh, z)
+    return out
+
+
+def _power(a, count):
+    out = {0: (0, 0, 0), 1: (0, 0, 1)}
+    while count:
+        if count & 1:
+            out = _then(out, a)
+        a = _then(a, a)
+        count >>= 1
+    return out
+
+
+class _Wave:
+    # A created wave and the pulses it was created from
+
+    def __init__(self, pulses):
+        self.pulses = pulses
+        self.on = np.array([p.gpio_on for p in pulses], dtype=np.int64)
+        self.off = np.array([p.gpio_off for p in pulses], dtype=np.int64)
+        self.delays = np.array([p.delay for p in pulses], dtype=np.int64)
+        self.micros = int(self.delays.sum())
+        mask = int(np.bitwise_or.reduce(self.on | self.off)) \
+            if len(pulses) else 0
+        self.pins = {pin for pin in range(32) if mask >> pin & 1}
+        self._summaries = {}
+
+    def levels(self, pin, level):
+        # A pin's level over each pulse, entering at level
+        touched = ((self.on | self.off) >> pin & 1).astype(bool)
+        high = self.on >> pin & 1
+        idx = np.where(touched, np.arange(len(touched)), -1)
+        if len(idx):
+            idx = np.maximum.accumulate(idx)
+        return np.where(idx < 0, level, high[idx])
+
+    def summary(self, pin):
+        if pin not in self._summaries:
+            out = {}
+            for x in 0, 1:
+                levels = self.levels(pin, x)
+                high = int(self.delays[levels == 1].sum())
+                out[x] = (self.micros - high, high,
+                          int(levels[-1]) if len(levels) else x)
+            self._summaries[pin] = out
+        return self._summaries[pin]
+
+    def runs(self, pin, level):
+        # (level, micros) of each pulse
+        return zip(self.levels(pin, level).tolist(), self.delays.tolist())
+
+
+class _Delay:
+
+    def __init__(self, micros):
+        self.micros = micros
+        self.pins = set()
+
+    def summary(self, pin):
+        return {0: (self.micros, 0, 0), 1: (0, self.micros, 1)}
+
+    def runs(self, pin, level):
+        return [(level, self.micros)]
+
+
+class _Loop:
+
+    def __init__(self, body, count):
+        self.body = body
+        self.count = count
+        self.unit = sum(x.micros for x in body)
+        self.micros = self.unit * count
+        self.pins = set().union(*(x.pins for x in body))
+
+    def summary(self, pin):
+        return _power(_summary(self.body, pin), self.count)
+
+    def runs(self, pin, level):
+        return _expand(self.body * self.count, pin, level)
+
+
+def _summary(items, pin):
+    out = {0: (0, 0, 0), 1: (0, 0, 1)}
+    for x in items:
+        out = _then(out, x.summary(pin))
+    return out
+
+
+def _expand(items, pin, level):
+    # (level, micros) runs of nested items, entering at level
+    for x in items:
+        for run in x.runs(pin, level):
+            level = run[0]
+            yield run
+
+
+def _held(items, pin, level, budget):
+    # (micros low, micros high, level after) of the first budget micros
+    # of nested items, entering at level
+    low = high = 0
+    for x in items:
+        if budget <= 0:
+            break
+        if x.micros <= budget:
+            dlow, dhigh, level = x.summary(pin)[level]
+        elif isinstance(x, _Loop):
+            k = budget // x.unit
+            dlow, dhigh, level = _power(_summary(x.body, pin), k)[level]
+            rest = _held(x.body, pin, level, budget - k * x.unit)
+            dlow, dhigh, level = dlow + rest[0], dhigh + rest[1], rest[2]
+        else:
+            dlow = dhigh = 0
+            for y, micros in x.runs(pin, level):
+                micros = min(micros, budget - dlow - dhigh)
+                if micros <= 0:
+                    break
+                level = y
+                if level:
+                    dhigh += micros
+                else:
+                    dlow += micros
+        low += dlow
+        high += dhigh
+        budget -= dlow + dhigh
+    return low, high, level
+
+
+def _parse_chain(data, waves):
+    # Nested items of a wave_chain command list
+    stack = [[]]
+    i = 0
+    while i < len(data):
+        x = data[i]
+        if x != CHAIN_ESCAPE:
+            try:
+                stack[-1].append(waves[x])
+            except KeyError:
+                raise pigpio.error('Chain refers to no wave {}'.format(x))
+            i += 1
+            continue
+        cmd = data[i + 1]
+        if cmd == LOOP_START:
+            stack.append([])
+            i += 2
+        elif cmd == LOOP_END:
+            if len(stack) < 2:
+                raise pigpio.error('Chain loop end without start')
+            body = stack.pop()
+            stack[-1].append(_Loop(body, data[i + 2] | data[i + 3] << 8))
+            i += 4
+        elif cmd == CHAIN_DELAY:
+            stack[-1].append(_Delay(data[i + 2] | data[i + 3] << 8))
+            i += 4
+        else:
+            raise pigpio.error('Chain command {} is not '
+                               'simulated'.format(cmd))
+    if len(stack) != 1:
+        raise pigpio.error('Chain loop start without end')
+    return stack[0]
+
+
+class Transmission:
+    # Waves sent with one command: when they were sent, started and
+    # stopped going out, and the level each pin entered them at
+
+    def __init__(self, items, sent, start, levels, wave_id=None):
+        self.items = items
+        self.wave_id = wave_id
+        self.sent = sent
+        self.start = start
+        self.length = sum(x.micros for x in items)
+        self.end = start + self.length
+        self.levels = dict(levels)
+        self.pins = set().union(*(x.pins for x in items))
+        self.settled = False
+
+    def waves(self):
+        stack = list(self.items)
+        while stack:
+            x = stack.pop()
+            if isinstance(x, _Loop):
+                stack += x.body
+            elif isinstance(x, _Wave):
+                yield x
+
+    def held(self, pin, until=None):
+        # (micros low, micros high, level after) of pin up to until, if
+        # the waves drive it
+        end = self.end if until is None else max(min(self.end, until),
+                                                 self.start)
+        level = self.levels.get(pin, 0)
+        if pin not in self.pins:
+            return 0, 0, level
+        if end - self.start == self.length:
+            return _summary(self.items, pin)[level]
+        return _held(self.items, pin, level, end - self.start)
+
+    def trace(self, pin):
+        # (level, micros) runs up to where the transmission was stopped
+        if pin not in self.pins:
+            return
+        t = self.start
+        for level, micros in _expand(self.items, pin,
+                                     self.levels.get(pin, 0)):
+            micros = min(micros, self.end - t)
+            if micros <= 0:
+                return
+            yield level, micros
+            t += micros
+
+
+class SimulatedPi:
+    # A pigpio client with a simulated daemon behind it, for running the
+    # driver without a Raspberry Pi. It implements the calls the driver
+    # makes, on a VirtualClock, and records every transmission so that
+    # the levels a program drove its pins to can be checked afterwards.
+    # Creating a wave advances the clock by create_latency plus
+    # pulse_latency per pulse. A wave goes out tx_latency after it is
+    # sent, or as soon as the wave before it ends if it was sent in time
+    # with ONE_SHOT_SYNC. Resources are accounted for as by pigpiod, so
+    # waves the daemon would refuse are refused.
+
+    def __init__(self, clock=None, max_pulses=SIM_MAX_PULSES,
+                 max_cbs=SIM_MAX_CBS, max_micros=SIM_MAX_MICROS,
+                 create_latency=CREATE_LATENCY, pulse_latency=PULSE_LATENCY,
+                 tx_latency=TX_LATENCY):
+        self.clock = VirtualClock() if clock is None else clock
+        self.connected = True
+
+        self._max_pulses = max_pulses
+        self._max_cbs = max_cbs
+        self._max_micros = max_micros
+        self.create_latency = create_latency
+        self.pulse_latency = pulse_latency
+        self.tx_latency = tx_latency
+
+        self._modes = {}
+        self._levels = {}
+        self._pending = []
+        self._waves = {}
+        self._used = {}
+
+        # Every transmission and pin write, in the order they were made
+        self.transmissions = []
+        self.writes = []
+
+    def _now(self):
+        return self.clock.micros
+
+    # GPIO
+    def set_mode(self, gpio, mode):
+        self._modes[gpio] = mode
+        return 0
+
+    def get_mode(self, gpio):
+        return self._modes.get(gpio, pigpio.INPUT)
+
+    def write(self, gpio, level):
+        level = int(bool(level))
+        self._settle()
+        self._levels[gpio] = level
+        self.writes.append((self._now(), gpio, level))
+        return 0
+
+    def read(self, gpio):
+        self._settle()
+        return self._levels.get(gpio, 0)
+
+    def get_current_tick(self):
+        return self._now() & 0xffffffff
+
+    def stop(self):
+        self.connected = False
+
+    # Waves
+    def wave_get_max_pulses(self):
+        return self._max_pulses
+
+    def wave_get_max_cbs(self):
+        return self._max_cbs
+
+    def wave_get_max_micros(self):
+        return self._max_micros
+
+    def wave_clear(self):
+        self.wave_tx_stop()
+        self._pending = []
+        self._waves = {}
+        self._used = {}
+        return 0
+
+    def wave_add_new(self):
+        self._pending = []
+        return 0
+
+    def wave_add_generic(self, pulses):
+        # Unlike pigpiod, appends pulses rather than merging them with
+        # those already added
+        self._pending += pulses
+        return len(self._pending)
+
+    def wave_create(self):
+        n = len(self._pending)
+        return self._create(n, n * SIM_CBS_PER_PULSE)
+
+    def wave_create_and_pad(self, percent):
+        return self._create(self._max_pulses * percent // 100,
+                            self._max_cbs * percent // 100)
+
+    def _create(self, pulses, cbs):
+        # A wave taking up pulses and cbs of the daemon's resources
+        n = len(self._pending)
+        if n > pulses or n * SIM_CBS_PER_PULSE > cbs:
+            raise pigpio.error('Waveform of {} pulses too large'.format(n))
+        used_pulses = sum(x[0] for x in self._used.values())
+        used_cbs = sum(x[1] for x in self._used.values())
+        if used_pulses + pulses > self._max_pulses or \
+                used_cbs + cbs > self._max_cbs:
+            raise pigpio.error('No more CBs for waveform')
+        free = [w for w in range(SIM_MAX_WAVES) if w not in self._waves]
+        if not free:
+            raise pigpio.error('No more waveforms')
+
+        wid = free[0]
+        self._waves[wid] = _Wave(self._pending)
+        self._used[wid] = (pulses, cbs)
+        self._pending = []
+        self.clock.advance((self.create_latency +
+                            self.pulse_latency * n) / 1000000)
+        return wid
+
+    def wave_delete(self, wave_id):
+        wave = self._waves.get(wave_id)
+        for tx in self._active():
+            if any(x is wave for x in tx.waves()):
+                raise pigpio.error('Wave {} deleted while '
+                                   'transmitting'.format(wave_id))
+        self._waves.pop(wave_id, None)
+        self._used.pop(wave_id, None)
+        return 0
+
+    def _wave(self, wave_id):
+        try:
+            return self._waves[wave_id]
+        except KeyError:
+            raise pigpio.error('Non existent wave id {}'.format(wave_id))
+
+    # Transmission
+    def _active(self):
+        # Transmissions going out or waiting to; there are never more
+        # than two
+        now = self._now()
+        return [tx for tx in self.transmissions[-2:] if tx.end > now]
+
+    def _settle(self):
+        # Leave pins at the levels finished transmissions left them at
+        now = self._now()
+        for tx in self.transmissions[-2:]:
+            if tx.end <= now and not tx.settled:
+                for pin in tx.pins:
+                    self._levels[pin] = tx.held(pin)[2]
+                tx.settled = True
+
+    def _send(self, items, start, wave_id=None):
+        self._settle()
+        # A synced wave enters pins at the levels the one before leaves
+        levels = dict(self._levels)
+        for tx in self._active():
+            for pin in tx.pins:
+                levels[pin] = tx.held(pin)[2]
+        self.transmissions.append(Transmission(items, self._now(), start,
+                                               levels, wave_id))
+
+    def wave_send_once(self, wave_id):
+        return self.wave_send_using_mode(wave_id, pigpio.WAVE_MODE_ONE_SHOT)
+
+    def wave_send_using_mode(self, wave_id, mode):
+        wave = self._wave(wave_id)
+        start = self._now() + self.tx_latency
+        if mode == pigpio.WAVE_MODE_ONE_SHOT_SYNC:
+            active = self._active()
+            if active:
+                start = max(start, active[-1].end)
+        elif mode == pigpio.WAVE_MODE_ONE_SHOT:
+            self.wave_tx_stop()
+        else:
+            raise pigpio.error('Wave mode {} is not simulated'.format(mode))
+        self._send([wave], start, wave_id)
+        return len(wave.pulses) * SIM_CBS_PER_PULSE
+
+    def wave_chain(self, data):
+        items = _parse_chain(list(data), self._waves)
+        self.wave_tx_stop()
+        self._send(items, self._now() + self.tx_latency)
+        return 0
+
+    def wave_tx_busy(self):
+        return int(bool(self._active()))
+
+    def wave_tx_at(self):
+        # Like pigpiod, only knows waves sent on their own
+        now = self._now()
+        for tx in self._active():
+            if tx.start <= now:
+                if tx.wave_id is None:
+                    return pigpio.WAVE_NOT_FOUND
+                return tx.wave_id
+        return pigpio.NO_TX_WAVE
+
+    def wave_tx_stop(self):
+        # Cut the wave going out short, and forget any waiting to
+        now = self._now()
+        for tx in self._active():
+            if tx.start < now:
+                tx.end = now
+            else:
+                self.transmissions.remove(tx)
+        self._settle()
+        return 0
+
+    # Recordings
+    def held(self, pin):
+        # Micros pin was held (low, high) by waves driving it so far
+        now = self._now()
+        low = high = 0
+        for tx in self.transmissions:
+            x = tx.held(pin, now)
+            low += x[0]
+            high += x[1]
+        return low, high
+
+    def trace(self, pin):
+        # (start, level, micros) of the runs waves drove pin through so
+        # far, where pulses at the same level back to back make one run
+        now = self._now()
+        start = level = None
+        micros = 0
+        for tx in self.transmissions:
+            t = tx.start
+            for x, length in tx.trace(pin):
+                length = min(length, now - t)
+                if length <= 0:
+                    break
+                if x == level and start + micros == t:
+                    micros += length
+                else:
+                    if level is not None:
+                        yield start, level, micros
+                    start, level, micros = t, x, length
+                t += length
+        if level is not None:
+            yield start, level, micros
+
+    def gaps(self):
+        # Micros from each transmission ending to the next starting
+        return [b.start - a.end for a, b in
+                zip(self.transmissions, self.transmissions[1:])]
+
+    def leads(self):
+        # Micros each transmission was sent ahead of the one before it
+        # ending, negative where it was sent too late to follow on
+        return [a.end - b.sent for a, b in
+                zip(self.transmissions, self.transmissions[1:])]
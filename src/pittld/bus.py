@@ -0,0 +1,33 @@
+from threading import Lock
+
+from pittld import logger
+
+
+# Event bus
+class EventBus:
+    # Fans published events out to subscribed callbacks. Callbacks run on
+    # the publishing thread, so they must hand work off rather than block.
+
+    def __init__(self):
+        self._subscribers = []
+        self._lock = Lock()
+
+    def subscribe(self, fcn):
+        with self._lock:
+            self._subscribers.append(fcn)
+
+    def unsubscribe(self, fcn):
+        with self._lock:
+            try:
+                self._subscribers.remove(fcn)
+            except ValueError:
+                pass
+
+    def publish(self, event, data=None):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for fcn in subscribers:
+            try:
+                fcn(event, data)
+            except Exception as e:
+                logger.error('Event subscriber failed: {}'.format(e))
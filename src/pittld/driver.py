@@ -1,10 +1,27 @@
-from collections import namedtuple
-import random
+from collections import deque, namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import hashlib
+from itertools import count
+import math
+import os
+from threading import Condition, Lock
 import time
 
+import numpy as np
 import pigpio
 
 from pittld import logger
+from pittld.backend import clock_of, connect, RESERVED_PINS
+from pittld.bus import EventBus
+from pittld.jobs import Job, JobCancelled
+from pittld.metrics import Registry
+from pittld.playback import PAD, Player
+from pittld.sequence import (Chain, digest, MergedSequence, OFF,
+                             PeriodicSequence, SeededSequence, new_seed,
+                             random_sequence, regular_sequence, runs,
+                             summarize)
+from pittld.store import COMMITTED, STAGED, Store
 from pittld.svc import BaseService
 
 
@@ -15,86 +32,232 @@ class DriverException(Exception):
 
 # GPIO/misc Constants
 PIN = 14
-ON = 0
-OFF = 1
+MAX_PIN = 31
 MICROS = 1e6
 DISP_DELAY = 4
+PROGRESS_DELAY = 1
+CHECKPOINT_DELAY = 60
+HANDOFF_POLL = 1e-3
+DRIFT_HISTORY = 100
 
+# Background staging: kinds of sequence, the share of a job's progress
+# spent generating rather than summarizing, and finished jobs remembered
+SEQUENCE_KINDS = ('random', 'seeded', 'regular')
+GENERATION_SHARE = {'random': 0.5, 'seeded': 0.0, 'regular': 0.0}
+JOB_HISTORY = 16
 
-# Initialize the pigpio client
-pi = pigpio.pi()
-pi.set_mode(PIN, pigpio.OUTPUT)
-pi.write(PIN, OFF)
+# Processes generating large random sequences
+GEN_WORKERS = os.cpu_count() or 1
 
 
 # Pigpio constants
-MAX_MICROS = pi.wave_get_max_micros()
-MAX_PULSES = 2000
+# Control blocks a pulse may take: one each to set, clear and wait
+CBS_PER_PULSE = 3
+MAX_DELAY = (1 << 32) - 1
+
+# Wave limits of a daemon with pigpio's default buffers, used where no
+# daemon is at hand to ask
+MAX_MICROS = 30 * 60 * 1000000
+MAX_PULSES = 4169
+
+# Chunk sizing: a chunk must last CHUNK_LEAD times as long as the next
+# one takes to compile and create, given the measured cost of a pulse,
+# but never holds fewer than MIN_PULSES runs
+CHUNK_LEAD = 2
+MIN_PULSES = 64
+DEFAULT_COST = 20
+COST_WEIGHT = 0.2
+
+# Pulses the waveforms of recently compiled chunks may hold between them
+CACHE_PULSES = 1 << 15
 
 
 # Low-level routines
-def regular_sequence(n, m):
-    f = round(n / m - 0.5)
-    a = round(n / f - 0.5)
-    unit_head = str(ON) * m
-    unit_tail = str(OFF) * (f - m)
-    unit = unit_head + unit_tail
-    seq = unit * a
-
-    return seq
-
-
-def random_sequence(n, m):
-    head = [ON] * m
-    tail = [OFF] * (n - m)
-    seq = head + tail
-
-    # Knuth shuffle
-    for i in range(n - 1):
-        j = random.randint(i, n - 1)
-        a = seq[i]
-        seq[i] = seq[j]
-        seq[j] = a
-
-    return seq
-
-
-def split(seq, res):
-    seq_len = len(seq)
-    seq_micros = seq_len * res * MICROS
-    # chain_len = round(seq_micros / FCN_MAX_MICROS - 0.5)
-    chain_len = round(seq_len / MAX_PULSES - 0.5)
-    try:
-        wf_len = round(seq_len / chain_len - 0.5)
-        extra_len = seq_len % wf_len
-    except ZeroDivisionError:
-        wf_len = 0
-        extra_len = seq_len
-
-    chain = []
-    for i in range(chain_len):
-        start_idx = wf_len * i
-        stop_idx = start_idx + wf_len
-        chain.append(seq[start_idx:stop_idx])
-
-    if extra_len:
-        start_idx = wf_len * chain_len
-        chain.append(seq[start_idx:-1])
-
-    return chain
-
-
-def waveform(seq, res):
+def pulse_budget(pi):
+    # Pulses one of the two waves in flight may use: each is padded to
+    # PAD percent of the daemon's pulses and control blocks
+    pulses = min(pi.wave_get_max_pulses(),
+                 pi.wave_get_max_cbs() // CBS_PER_PULSE)
+    return pulses * PAD // 100
+
+
+def claim(pi, pins):
+    # Make pins outputs; pins are left as they are if they already are
+    for pin in pins:
+        if pi.get_mode(pin) != pigpio.OUTPUT:
+            pi.set_mode(pin, pigpio.OUTPUT)
+            pi.write(pin, OFF)
+
+
+def split(seq, res, cost=None, max_pulses=MAX_PULSES,
+          max_micros=MAX_MICROS):
+    # Chunks hold at most max_pulses runs and last at most max_micros.
+    # Given the cost of a pulse in micros, a chunk after a short one is
+    # kept small enough to be compiled while that one plays.
+    micros = int(res * MICROS)
+    max_slots = max(max_micros // micros, 1)
+
+    def budget(slots):
+        if cost is None:
+            return max_pulses
+        lead = slots * micros / (CHUNK_LEAD * cost)
+        return int(min(max_pulses, max(MIN_PULSES, lead)))
+
+    bounds = [0]
+    count = 0
+    pulses = max_pulses
+    for stop, starts, _ in runs(seq, MAX_DELAY // micros):
+        i = 0
+        while True:
+            limit = bounds[-1] + max_slots
+            j = i + pulses - count
+            if j < len(starts) and starts[j] < limit:
+                bounds.append(int(starts[j]))
+                count = 1
+                i = j + 1
+                pulses = budget(bounds[-1] - bounds[-2])
+            elif limit < stop:
+                k = int(np.searchsorted(starts, limit))
+                bounds.append(limit)
+                count = 1
+                i = k + int(k < len(starts) and starts[k] == limit)
+                pulses = budget(bounds[-1] - bounds[-2])
+            else:
+                count += len(starts) - i
+                break
+
+    if len(seq):
+        bounds.append(len(seq))
+
+    return Chain(seq, np.array(bounds, dtype=np.int64))
+
+
+def loopable(seq, res, max_micros=MAX_MICROS):
+    # Whether seq can be played as one looped wave per period
+    if not isinstance(seq, PeriodicSequence) or not seq.repeats:
+        return False
+    micros = int(res * MICROS)
+    unit_micros = len(seq.unit) * micros
+    return unit_micros <= max_micros and \
+        (seq.n - seq.body) * micros <= max_micros
+
+
+def compile_chunk(seq, res, pins=(PIN,), cache=None):
+    # (waveform, length in micros, content key, whether it was cached).
+    # Chunks with the same runs at the same resolution on the same pins
+    # have the same waveform, which is only built once while cached.
+    micros = int(res * MICROS)
+    levels, lengths = scan(seq, micros)
+    key = chunk_key(levels, lengths, micros, pins)
+    if cache is not None:
+        hit = cache.get(key)
+        if hit is not None:
+            return hit + (key, True)
+
+    wf = pulses(levels, lengths, micros, pins)
+    total = int(lengths.sum()) * micros
+    if cache is not None:
+        cache.put(key, wf, total)
+    return wf, total, key, False
+
+
+def waveform(seq, res, pins=(PIN,)):
+    micros = int(res * MICROS)
+    return pulses(*scan(seq, micros), micros, pins)
+
+
+def scan(seq, micros):
+    # (level, length in slots) of each run of equal slots, where no run
+    # lasts longer than a pulse can
+    scanned = list(runs(seq, MAX_DELAY // micros))
+    if not scanned:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    starts = np.concatenate([x[1] for x in scanned])
+    levels = np.concatenate([x[2] for x in scanned])
+    return levels, np.diff(np.append(starts, len(seq)))
+
+
+def chunk_key(levels, lengths, micros, pins):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(np.ascontiguousarray(levels, dtype=np.int64).tobytes())
+    h.update(np.ascontiguousarray(lengths, dtype=np.int64).tobytes())
+    return h.hexdigest(), micros, tuple(pins)
+
+
+def pulses(levels, lengths, micros, pins=(PIN,)):
+    # One pulse per run. For merged sequences, bit i of a level drives
+    # pins[i], and a run ends wherever any channel changes.
+    if not len(levels):
+        return []
+
+    # GPIO masks to set (OFF) and clear (ON) for every distinct level
+    masks = {}
+    for level in np.unique(levels).tolist():
+        high = sum(1 << pin for i, pin in enumerate(pins) if level >> i & 1)
+        low = sum(1 << pin for pin in pins) & ~high
+        masks[level] = (high, low)
+
     wf = []
-    for i in seq:
-        if i == ON:
-            p = pigpio.pulse(0, 1 << PIN, int(res * MICROS))
-        else:
-            p = pigpio.pulse(1 << PIN, 0, int(res * MICROS))
-        wf.append(p)
+    for level, length in zip(levels.tolist(), lengths.tolist()):
+        high, low = masks[level]
+        wf.append(pigpio.pulse(high, low, length * micros))
     return wf
 
 
+# Compile cache
+class CompileCache:
+    # Waveforms of recently compiled chunks by content key, least
+    # recently used first, holding at most max_pulses pulses between
+    # them. Shared by the run loop and the jobs precompiling programs.
+
+    def __init__(self, max_pulses=CACHE_PULSES, metrics=None):
+        self.max_pulses = max_pulses
+        self._entries = OrderedDict()
+        self._pulses = 0
+        self._lock = Lock()
+
+        metrics = Registry('pittld_cache') if metrics is None else metrics
+        self._hits = metrics.counter('compile_cache_hits_total',
+                                     'Chunks whose waveform was cached')
+        self._misses = metrics.counter('compile_cache_misses_total',
+                                       'Chunks compiled afresh')
+        self._evictions = metrics.counter('compile_cache_evictions_total',
+                                          'Waveforms dropped from the cache')
+        metrics.gauge('compile_cache_pulses', 'Pulses held in the cache',
+                      lambda: self._pulses)
+
+    def get(self, key):
+        # (waveform, length in micros), or None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses.inc()
+                return None
+            self._entries.move_to_end(key)
+            self._hits.inc()
+            return entry
+
+    def put(self, key, wf, micros):
+        if len(wf) > self.max_pulses:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = (wf, micros)
+            self._pulses += len(wf)
+            while self._pulses > self.max_pulses:
+                _, (old, _) = self._entries.popitem(last=False)
+                self._pulses -= len(old)
+                self._evictions.inc()
+
+    def stats(self):
+        return {'entries': len(self._entries),
+                'pulses': self._pulses,
+                'hits': self._hits.value,
+                'misses': self._misses.value,
+                'evictions': self._evictions.value}
+
+
 # Data structures
 # Domain = namedtuple('Domain', ['total', 'exposure'])
 class Domain:
@@ -117,6 +280,7 @@ class Timing:
     def __init__(self, total, exposure_frac, resolution):
         total = float(total)
         exposure_frac = float(exposure_frac)
+        self.params = (total, exposure_frac, resolution)
         exposure = total * exposure_frac
         self.resolution = resolution
         self.specified = Domain(total, exposure)
@@ -144,137 +308,972 @@ class Timing:
                            self.digital)
 
 
+class Channel:
+    # A staged sequence moved onto an output pin of its own, to be played
+    # alongside the program on PIN
+
+    def __init__(self, pin, timing, seq, stats):
+        self.pin = pin
+        self.timing = timing
+        self.seq = seq
+        self.stats = stats
+
+    def to_dict(self):
+        return {'pin': self.pin,
+                'timing': self.timing.to_dict(),
+                'length': len(self.seq),
+                'digest': self.stats and self.stats['hash']}
+
+    def __repr__(self):
+        return 'Channel(pin={}, n={})'.format(self.pin, len(self.seq))
+
+
+class Program:
+    # A staged program waiting in the queue. Its chain and first
+    # waveform are compiled ahead of time so that it can follow the
+    # program before it without a gap.
+
+    _ids = count(1)
+
+    def __init__(self, timing, seq, stats, ref, at=None, channels=()):
+        self.id = next(Program._ids)
+        self.timing = timing
+        self.seq = seq
+        self.stats = stats
+        self.ref = ref
+        self.at = at
+        self.channels = tuple(channels)
+
+        self.chain = None
+        self.first = None
+
+    @property
+    def pins(self):
+        return (PIN,) + tuple(c.pin for c in self.channels)
+
+    @property
+    def merged(self):
+        # What is split and compiled: the sequence, merged with those of
+        # the other channels if there are any
+        if not self.channels:
+            return self.seq
+        return MergedSequence([self.seq] + [c.seq for c in self.channels])
+
+    def due(self, t):
+        return self.at is None or self.at <= t
+
+    def to_dict(self):
+        return {'id': self.id,
+                'timing': self.timing.to_dict(),
+                'at': self.at,
+                'length': len(self.seq),
+                'digest': self.stats and self.stats['hash'],
+                'channels': [c.to_dict() for c in self.channels],
+                'compiled': self.first is not None}
+
+    def __repr__(self):
+        return 'Program(id={}, at={})'.format(self.id, self.at)
+
+
 # Service
 class Service(BaseService):
 
-    def __init__(self, lcd_svc):
+    def __init__(self, lcd_svc, pi=None):
         super().__init__()
         self.name = "driver"
 
+        # Waves are timed by the clock of the daemon playing them, while
+        # the display, progress and checkpoints keep to real time
+        self.pi = connect() if pi is None else pi
+        self.clock = clock_of(self.pi)
+        self.max_pulses = pulse_budget(self.pi)
+        self.max_micros = self.pi.wave_get_max_micros()
+
         self._lcd_svc = lcd_svc
-        self._last_disp = 0
+        self._last_disp = -math.inf
+        self._last_progress = -math.inf
+
+        # Program events: start, chunk, progress, stop, finish, error
+        self.bus = EventBus()
 
         self.staged_timing = None
         self.staged_seq = None
+        self.staged_stats = None
+        self._staged_ref = None
 
         self.committed_timing = None
         self.committed_seq = None
+        self.committed_stats = None
+
+        self._committed_ref = None
+
+        # Sequences played on other pins alongside the program, by pin
+        self.staged_channels = {}
+        self.committed_channels = ()
+        self._pins = (PIN,)
+
+        # Programs are only kept in memory unless a store is attached, in
+        # which case a running program is checkpointed so that it can be
+        # resumed after a restart
+        self.store = None
+        self._last_checkpoint = -math.inf
+        self._bounds_saved = False
+        self._resumable = None
+
+        # Staging jobs by id, oldest first, run one at a time
+        self._jobs = OrderedDict()
+        self._job_pool = ThreadPoolExecutor(max_workers=1)
 
         self._chain = None
         self._chain_idx = 0
         self.started = None
 
-        self._wid = None
+        # Programs to play after the committed one, and the one whose
+        # first waveform is already queued behind it
+        self.queue = []
+        self._next = None
+
+        # Where the run loop spends its time, for the manager to report
+        self.metrics = Registry('pittld_driver')
+        self._stage_time = self.metrics.histogram(
+            'stage_wf_seconds', 'Time to compile and queue a waveform')
+        self._start_time = self.metrics.histogram(
+            'start_wf_seconds', 'Time to compile and start a waveform')
+        self._loop_time = self.metrics.histogram(
+            'loop_seconds', 'Busy time of a run loop iteration')
+        self._loops = self.metrics.counter(
+            'loop_iterations_total', 'Run loop iterations')
+        self.metrics.gauge('queued_programs', 'Programs in the queue',
+                           lambda: len(self.queued))
+        self.metrics.gauge('pending_jobs', 'Staging jobs not yet done',
+                           lambda: sum(not job.done
+                                       for job in list(self._jobs.values())))
+
+        self._player = Player(self.pi, self.metrics)
+        self._cache = CompileCache(CACHE_PULSES, self.metrics)
+        self.cost = DEFAULT_COST
+        self._staged_idx = None
+
+        # Programs are timed by pigpio's ticks: the tick the playing chunk
+        # started on, and the one slot 0 played, or would have, on, with
+        # the system clock's time then
         self._wf_start = None
-        self._staged_wf = None
+        self._origin = None
+        self._wall_origin = None
+
+        # (index, scheduled, measured micros) of the program's latest
+        # chunks, their totals, and how far behind its schedule the
+        # playing chunk was seen to start. Chunks are measured between the
+        # ticks the run loop saw them start on, so to within HANDOFF_POLL.
+        self._wf_seen = None
+        self._chunk_times = deque(maxlen=DRIFT_HISTORY)
+        self._timed = 0
+        self._scheduled = 0
+        self._measured = 0
+        self._drift = 0
+        self.metrics.gauge('drift_micros', 'How far behind its schedule '
+                           'the playing chunk was seen to start',
+                           lambda: self._drift)
+
+        # Guards the playing program; start/stop notify the run loop
+        self._cond = Condition()
 
         # In case service is restarted
         # This shouldn't be happening, by the way
+        claim(self.pi, self._pins)
         self.stop_seq()
 
     def run(self):
         logger.info('Starting pigpio driver service')
 
-        while not self._kill:
-            self._display()
-
-            if self._chain and self._chain_idx < len(self._chain) - 1:
-                if self._staged_wf is None and self.wf_progress() >= 0.5:
+        with self._cond:
+            while not self._kill:
+                t = time.perf_counter()
+                self._display()
+                try:
+                    timeout = self._advance()
+                except Exception as e:
+                    logger.error('Program failed: {}'.format(e))
+                    self.bus.publish('error', str(e))
+                    self.stop_seq()
+                    timeout = None
+
+                idle = [self._last_disp + DISP_DELAY - time.monotonic()]
+                if self.started is not None:
+                    idle.append(self._publish_progress())
+                    idle.append(self._checkpoint())
+                if timeout is not None:
+                    timeout = max(timeout, 0)
+                self._loops.inc()
+                self._loop_time.observe(time.perf_counter() - t)
+                self.clock.wait(self._cond, timeout, max(min(idle), 0))
+
+    def kill(self):
+        super().kill()
+        with self._cond:
+            self._cancel_jobs()
+            self._cond.notify_all()
+        self._job_pool.shutdown(wait=False)
+
+    def _advance(self):
+        # Queue and retire waveforms that are due, and return the time
+        # until something next is, or None if nothing is playing
+        if self._wf_start is None and self.queue:
+            now = self.clock.time()
+            if not self.queue[0].due(now):
+                return self.queue[0].at - now
+            self._start_program(self.queue.pop(0))
+
+        while self._wf_start is not None:
+            if self._staged_idx is None:
+                if self._chain_idx < len(self._chain) - 1:
                     self._stage_wf(self._chain_idx + 1)
-                elif self.wf_progress() >= 1.0:
-                    self._stop_wf()
-                    self._chain_idx += 1
-                    self._start_wf()
-            elif self.wf_progress() >= 1.0:
-                self.stop_seq()
+                elif self.queue and not self._player.looping:
+                    wf_end = self.clock.time() + \
+                        self._player.remaining() / MICROS
+                    if self.queue[0].due(wf_end):
+                        self._stage_next(self.queue.pop(0))
+
+            # Due by the ticks, which the system clock cannot move
+            remaining = self._player.remaining()
+            if remaining:
+                return remaining / MICROS
+            if not self._player.advance():
+                return HANDOFF_POLL
+
+            if self._staged_idx is None:
+                self.stop_seq('finish')
+                return self._advance()
+            elif self._next is not None:
+                # The next program started as this one ended
+                program, self._next = self._next, None
+                self._staged_idx = None
+                self.bus.publish('finish')
+                self._commit(program, self._wall(self._player.started))
+                self._begin(0)
+                logger.info('Started queued program {}'.format(program.id))
+                self._publish_start()
+            else:
+                self._note_chunk(self._player.seen)
+                self._chain_idx = self._staged_idx
+                self._staged_idx = None
+                logger.info('Started waveform {}'.format(self._chain_idx))
+                self.bus.publish('chunk', {'index': self._chain_idx,
+                                           'chunks': len(self._chain)})
+        return None
+
+    def _publish_progress(self):
+        # Publish progress every PROGRESS_DELAY, returning the time until
+        # it is next due
+        t = time.monotonic()
+        if t - self._last_progress >= PROGRESS_DELAY:
+            self._last_progress = t
+            self.bus.publish('progress', self.progress())
+        return self._last_progress + PROGRESS_DELAY - t
+
+    def _checkpoint(self, force=False):
+        # Record where the running program is every CHECKPOINT_DELAY,
+        # returning the time until the next checkpoint is due
+        t = time.monotonic()
+        if self.store is None or self.committed_channels:
+            # Only single-channel programs can be resumed
+            return CHECKPOINT_DELAY
+        if force or t - self._last_checkpoint >= CHECKPOINT_DELAY:
+            self._last_checkpoint = t
+            if not self._bounds_saved:
+                self.store.save_bounds(COMMITTED, self._chain.bounds)
+                self._bounds_saved = True
+            self._save(COMMITTED, self.committed_timing, self._committed_ref,
+                       self.committed_stats, started=self.started,
+                       chunk=self._chain_idx,
+                       slot=int(self._chain.bounds[self._chain_idx]))
+        return self._last_checkpoint + CHECKPOINT_DELAY - t
+
+    def attach_store(self, path):
+        # Keep programs in a directory from now on, picking up the staged
+        # program left there by an earlier run, and the committed one if
+        # it was still running
+        with self._cond:
+            self.store = Store(path)
+            meta = self.store.load(STAGED)
+            if meta is not None:
+                try:
+                    self.staged_timing, self.staged_seq = self._load(meta)
+                    self.staged_stats = meta['stats']
+                    self._staged_ref = meta['sequence']
+                    logger.info('Restored staged timing '
+                                '{}'.format(self.staged_timing))
+                except Exception as e:
+                    logger.error('Could not restore staged program: '
+                                 '{}'.format(e))
+                    self.store.clear(STAGED)
+
+            meta = self.store.load(COMMITTED)
+            if meta is not None and meta.get('started') is not None:
+                self._resumable = meta
+                logger.info('Program started {} can be resumed'.format(
+                    datetime.fromtimestamp(meta['started'])))
+            elif meta is not None:
+                self.store.clear(COMMITTED)
+
+    def resumable(self):
+        # When the program that can be resumed started, and where it was
+        # last checkpointed
+        meta = self._resumable
+        if meta is None:
+            return None
+        return {'started': meta['started'],
+                'slot': meta['slot'],
+                'length': Timing(*meta['timing']).digital.total}
+
+    def _load(self, meta):
+        # (timing, sequence) of a program as described in the store
+        timing = Timing(*meta['timing'])
+        ref = meta['sequence']
+        if ref is None:
+            return timing, None
+
+        n = timing.digital.total
+        m = timing.digital.exposure
+        if ref['kind'] == 'random':
+            seq = self.store.open_bits(ref['file'], n)
+        elif ref['kind'] == 'seeded':
+            seq = SeededSequence(n, m, ref['seed'])
+        else:
+            seq = regular_sequence(n, m)
+        return timing, seq
+
+    def _hold(self, ref):
+        # Keep the bit file of a program queued or playing, which no
+        # description in the store may refer to
+        if self.store is not None and ref and ref['file'] is not None:
+            self.store.hold(ref['file'])
+
+    def _release(self, ref):
+        if self.store is not None and ref and ref['file'] is not None:
+            self.store.release(ref['file'])
+
+    def _save(self, name, timing, ref, stats, **extra):
+        if self.store is not None:
+            meta = {'timing': timing.params, 'sequence': ref, 'stats': stats}
+            meta.update(extra)
+            self.store.save(name, meta)
 
     def stage_timing(self, data):
+        timing = self._parse_timing(data)
+        with self._cond:
+            self._cancel_jobs()
+            self._swap(None, None, None, timing)
+        logger.info('Staged timing {} '
+                    '(and reset sequence)'.format(self.staged_timing))
+
+    def _parse_timing(self, data):
         try:
-            self.staged_timing = Timing(*data)
+            return Timing(*data)
         except Exception as e:
             logger.error(e)
             raise DriverException('Object to be staged could '
                                   'not be interpreted as timing')
-        self.staged_seq = None
-        logger.info('Staged timing {} '
-                    '(and reset sequence)'.format(self.staged_timing))
 
-    def stage_seq_rand(self):
+    def _timing(self):
         if self.staged_timing is None:
             raise DriverException('No timing staged')
-        self.staged_seq = random_sequence(self.staged_timing.digital.total,
-                                          self.staged_timing.digital.exposure)
-        logger.info('Staged random sequence')
+        return self.staged_timing
+
+    def stage_seq_rand(self, seed=None):
+        ref = self._stage_seq('random', seed)
+        logger.info('Staged random sequence (seed {})'.format(ref['seed']))
+
+    def stage_seq_seeded(self, seed=None):
+        ref = self._stage_seq('seeded', seed)
+        logger.info('Staged seeded sequence (seed {})'.format(ref['seed']))
 
     def stage_seq_reg(self):
-        if self.staged_timing is None:
-            raise DriverException('No timing staged')
-        self.staged_seq = regular_sequence(self.staged_timing.digital.total,
-                                           self.staged_timing.digital.exposure)
+        self._stage_seq('regular')
         logger.info('Staged regular sequence')
 
-    def _stage_wf(self, idx):
-        logger.info('Staging waveform {}'.format(idx))
+    def _generate(self, kind, timing, seed=None, progress=None):
+        # (sequence, reference) of the given kind for timing, where the
+        # reference is what the store needs to get the sequence back
+        n = timing.digital.total
+        m = timing.digital.exposure
+        if kind not in SEQUENCE_KINDS:
+            raise DriverException('Unknown sequence kind {}'.format(kind))
+        if seed is None and kind != 'regular':
+            seed = new_seed()
+        ref = {'kind': kind, 'seed': seed, 'file': None}
 
-        self._staged_wf = waveform(self._chain[idx],
-                                   self.committed_timing.resolution)
+        try:
+            if kind == 'random':
+                out = None
+                if self.store is not None:
+                    ref['file'], out = self.store.allocate(n)
+                seq = random_sequence(n, m, seed, progress, GEN_WORKERS, out)
+            elif kind == 'seeded':
+                seq = SeededSequence(n, m, seed)
+            else:
+                seq = regular_sequence(n, m)
+        except (TypeError, ValueError) as e:
+            self._discard(ref)
+            logger.error(e)
+            raise DriverException('{} sequence could not be generated '
+                                  'for staged timing'.format(kind.title()))
+        except BaseException:
+            self._discard(ref)
+            raise
+        return seq, ref
+
+    def _discard(self, ref):
+        if ref['file'] is not None:
+            self.store.discard(ref['file'])
+
+    def _stage_seq(self, kind, seed=None):
+        timing = self._timing()
+        seq, ref = self._generate(kind, timing, seed)
+        # Statistics are computed once here rather than per query
+        stats = summarize(seq)
+        with self._cond:
+            if self.staged_timing is not timing:
+                # Generated for timing staged over while it ran
+                self._discard(ref)
+                raise DriverException('Staged timing changed')
+            self._cancel_jobs()
+            self._swap(seq, ref, stats)
+        return ref
+
+    def _swap(self, seq, ref, stats, timing=None):
+        # Replace the staged program as a whole; the caller holds _cond
+        if timing is not None:
+            self.staged_timing = timing
+        self.staged_seq = seq
+        self.staged_stats = stats
+        self._staged_ref = ref
+        self._save(STAGED, self.staged_timing, ref, stats)
+
+    def submit_stage(self, kind, seed=None, timing=None):
+        # Stage a sequence, and timing if given, in the background. The
+        # result replaces the staged program only once it is complete,
+        # and only if nothing else was staged in the meantime.
+        if kind not in SEQUENCE_KINDS:
+            raise DriverException('Unknown sequence kind {}'.format(kind))
+        if timing is None:
+            timing = self._timing()
+            with_timing = False
+        else:
+            timing = self._parse_timing(timing)
+            with_timing = True
+
+        job = Job(kind)
+        with self._cond:
+            # A newer staging request supersedes older ones
+            self._cancel_jobs()
+            self._jobs[job.id] = job
+            while len(self._jobs) > JOB_HISTORY:
+                oldest = next(iter(self._jobs.values()))
+                if not oldest.done:
+                    break
+                self._jobs.popitem(last=False)
+            self._job_pool.submit(self._run_job, job, timing,
+                                  with_timing, seed)
+        logger.info('Submitted staging job {}'.format(job.id))
+        return job
+
+    def _run_job(self, job, timing, with_timing, seed):
+        share = GENERATION_SHARE[job.kind]
+        ref = None
+        try:
+            job.start()
+            seq, ref = self._generate(job.kind, timing, seed,
+                                      job.phase(0, share))
+            stats = summarize(seq, job.phase(share, 1))
+            with self._cond:
+                job.check()
+                if not with_timing and self.staged_timing is not timing:
+                    raise DriverException('Staged timing changed')
+                self._swap(seq, ref, stats, timing)
+                job.finish('done')
+            logger.info('Staging job {} staged {} sequence '
+                        '(seed {})'.format(job.id, job.kind, ref['seed']))
+        except JobCancelled:
+            job.finish('cancelled')
+            logger.info('Staging job {} cancelled'.format(job.id))
+        except Exception as e:
+            job.finish('failed', str(e))
+            logger.error('Staging job {} failed: {}'.format(job.id, e))
+        if job.state != 'done' and ref is not None:
+            self._discard(ref)
+        self.bus.publish('job', job.to_dict())
+
+    def _cancel_jobs(self):
+        for job in self._jobs.values():
+            job.cancel()
+
+    def cancel_job(self, job_id):
+        job = self.job(job_id)
+        with self._cond:
+            cancelled = job.cancel()
+        if not cancelled:
+            raise DriverException('Job {} already finished'.format(job_id))
+
+    def job(self, job_id):
+        try:
+            return self._jobs[job_id]
+        except (KeyError, TypeError):
+            raise DriverException('No job {}'.format(job_id))
 
-    def _stop_wf(self):
-        pi.wave_tx_stop()
-        if self._wid is not None:
-            logger.info('Stopping waveform {}'.format(self._chain_idx))
+    def jobs(self):
+        return list(self._jobs.values())
 
-            pi.wave_delete(self._wid)
-            self._wid = None
+    def _compile_wf(self, idx):
+        return compile_chunk(self._chain[idx],
+                             self.committed_timing.resolution, self._pins,
+                             self._cache)
 
-    def _start_wf(self):
-        self._stop_wf()
+    def _stage_wf(self, idx):
+        logger.info('Staging waveform {}'.format(idx))
 
-        logger.info('Starting waveform {}'.format(self._chain_idx))
+        t = self.clock.perf_counter()
+        wf, micros, key, cached = self._compile_wf(idx)
+        created = self._player.queue(wf, micros, key)
+        t = self.clock.perf_counter() - t
+        self._stage_time.observe(t)
+        if created and not cached:
+            self._note_cost(t, len(wf))
+        self._staged_idx = idx
 
-        if self._staged_wf is not None:
-            pi.wave_add_generic(self._staged_wf)
-            self._wid = pi.wave_create()
-            self._wf_start = time.time()
-            pi.wave_send_once(self._wid)
-            self._staged_wf = None
-        else:
-            raise DriverException('No staged waveform found.')
+    def _start_wf(self):
+        logger.info('Starting waveform {}'.format(self._chain_idx))
 
-    def stop_seq(self):
-        self._stop_wf()
-        pi.write(PIN, OFF)
+        t = self.clock.perf_counter()
+        wf, micros, key, cached = self._compile_wf(self._chain_idx)
+        created = self._player.start(wf, micros, key)
+        t = self.clock.perf_counter() - t
+        self._start_time.observe(t)
+        if created and not cached:
+            self._note_cost(t, len(wf))
+        self._begin(int(self._chain.bounds[self._chain_idx]))
+
+    def _begin(self, slot):
+        # Time the committed program from the tick its playing chunk,
+        # which starts on slot, started on
+        self._wf_start = self._player.started
+        self._origin = self._wf_start - \
+            slot * self.committed_timing.resolution * MICROS
+        self._wall_origin = self._wall(self._origin)
+        self._wf_seen = self._player.seen
+        self._chunk_times.clear()
+        self._timed = 0
+        self._scheduled = 0
+        self._measured = 0
+        self._drift = 0
+
+    def _note_chunk(self, seen):
+        # The playing chunk ended and the staged one was seen playing on
+        # tick seen
+        res = self.committed_timing.resolution * MICROS
+        scheduled = round(self._chain.span(self._chain_idx) * res)
+        measured = seen - self._wf_seen
+        self._chunk_times.append((self._chain_idx, scheduled, measured))
+        self._timed += 1
+        self._scheduled += scheduled
+        self._measured += measured
+        self._drift = round(seen - self._origin -
+                            int(self._chain.bounds[self._staged_idx]) * res)
+        self._wf_start = self._player.started
+        self._wf_seen = seen
+
+    def _wall(self, tick):
+        # The system clock's time at tick
+        return self.clock.time() - \
+            (self._player.ticks.now() - tick) / MICROS
+
+    def _note_cost(self, seconds, pulses):
+        # Running estimate of the micros it takes to compile and create a
+        # pulse, which sizes the chunks of programs started later. Only
+        # chunks compiled and created afresh count, as a chunk that is
+        # cached now may not be next time.
+        if pulses:
+            cost = seconds * MICROS / pulses
+            self.cost += COST_WEIGHT * (cost - self.cost)
+
+    def _split(self, seq, res, cost=None):
+        return split(seq, res, cost, self.max_pulses, self.max_micros)
+
+    def _loopable(self, seq, res):
+        return loopable(seq, res, self.max_micros)
+
+    def _chunk_cost(self, program):
+        # The cost to size program's chunks by, or None if its pulses come
+        # faster than they can be compiled anyway, in which case the
+        # largest chunks waste the least time on handoffs
+        micros = int(program.timing.resolution * MICROS)
+        nruns = sum(x.stats['runs'] if x.stats else len(x.seq)
+                    for x in (program,) + program.channels)
+        if nruns and len(program.seq) * micros / nruns < \
+                CHUNK_LEAD * self.cost:
+            logger.warning('Program {} may outpace waveform '
+                           'compilation'.format(program.id))
+            return None
+        return self.cost
+
+    def chunking(self):
+        return {'max_pulses': self.max_pulses,
+                'max_micros': self.max_micros,
+                'cost': self.cost,
+                'cache': dict(self._cache.stats(),
+                              reused_waves=self._player.reused)}
+
+    def _start_loop(self, offset=0):
+        # Loop the periods of the sequence from slot offset, which must
+        # lie before its tail
+        seq = self.committed_seq
+        res = self.committed_timing.resolution
+        periods, phase = divmod(offset, len(seq.unit))
+        repeats = seq.repeats - periods
+        head = None
+        if phase:
+            head = waveform(seq.unit[phase:], res)
+            repeats -= 1
+        logger.info('Starting looped waveform '
+                    '({} periods)'.format(repeats))
+
+        unit = waveform(seq.unit, res)
+        tail = waveform(seq[seq.body:], res)
+        self._player.loop(unit, repeats, tail, head)
+        self._begin(offset)
+
+    def stop_seq(self, reason='stop'):
+        with self._cond:
+            if self.started is not None:
+                self.bus.publish(reason)
+            self._halt()
+            self._resumable = None
+            if self.store is not None:
+                self.store.clear(COMMITTED)
+            self._cond.notify_all()
+
+    def _halt(self):
+        # Stop playing and forget the committed program, leaving any
+        # checkpoint of it alone
+        self._player.stop()
+        for pin in self._pins:
+            self.pi.write(pin, OFF)
+        self._pins = (PIN,)
+        self.committed_channels = ()
         self.committed_timing = None
         self.committed_seq = None
+        self.committed_stats = None
+        self._release(self._committed_ref)
+        self._committed_ref = None
 
         self._chain = None
         self._chain_idx = 0
         self.started = None
-        self._staged_wf = None
+        self._staged_idx = None
         self._wf_start = None
+        self._origin = None
+        if self._next is not None:
+            # Its first waveform was deleted with the rest
+            self.queue.insert(0, self._next)
+            self._next = None
 
     def start_seq(self):
-        if self.staged_timing is None:
-            raise DriverException('No timing staged')
-        if self.staged_seq is None:
-            raise DriverException('No sequence staged')
-        if self._chain is not None:
-            raise DriverException('Sequence already in progress')
-        logger.info('Committing and starting sequence')
-
-        self.committed_timing = self.staged_timing
-        self.committed_seq = self.staged_seq
-
-        self._chain = split(self.committed_seq,
-                            self.committed_timing.resolution)
-        logger.debug('Sequence split into '
-                     'chain with {} sub-sequence(s)'.format(len(self._chain)))
-
-        self.started = time.time()
+        with self._cond:
+            if self.staged_timing is None:
+                raise DriverException('No timing staged')
+            if self.staged_seq is None:
+                raise DriverException('No sequence staged')
+            if self._chain is not None:
+                raise DriverException('Sequence already in progress')
+            logger.info('Committing and starting sequence')
+
+            program = self._staged_program()
+            self._hold(program.ref)
+            self._start_program(program)
+            self._cond.notify_all()
+
+    def _staged_program(self, at=None):
+        channels = [self.staged_channels[pin]
+                    for pin in sorted(self.staged_channels)]
+        for c in channels:
+            if c.timing.resolution != self.staged_timing.resolution:
+                raise DriverException('Channel on pin {} has a different '
+                                      'resolution'.format(c.pin))
+            if len(c.seq) > len(self.staged_seq):
+                raise DriverException('Channel on pin {} outlasts the '
+                                      'program'.format(c.pin))
+        return Program(self.staged_timing, self.staged_seq,
+                       self.staged_stats, self._staged_ref, at, channels)
+
+    def stage_channel(self, pin):
+        # Move the staged timing and sequence onto an extra output pin
+        with self._cond:
+            if self.staged_timing is None:
+                raise DriverException('No timing staged')
+            if self.staged_seq is None:
+                raise DriverException('No sequence staged')
+            pin = self._channel_pin(pin)
+            self.staged_channels[pin] = Channel(pin, self.staged_timing,
+                                                self.staged_seq,
+                                                self.staged_stats)
+        logger.info('Staged channel on pin {}'.format(pin))
+
+    def clear_channel(self, pin=None):
+        # Remove one staged channel, or all of them
+        with self._cond:
+            if pin is None:
+                self.staged_channels = {}
+                return
+            pin = self._channel_pin(pin)
+            if self.staged_channels.pop(pin, None) is None:
+                raise DriverException('No channel on pin {}'.format(pin))
+
+    def _channel_pin(self, pin):
+        try:
+            pin = int(pin)
+        except (TypeError, ValueError):
+            raise DriverException('Pin could not be interpreted')
+        if pin == PIN or not 0 <= pin <= MAX_PIN:
+            raise DriverException('Pin {} cannot carry a '
+                                  'channel'.format(pin))
+        if pin in RESERVED_PINS:
+            raise DriverException('Pin {} is used by another '
+                                  'service'.format(pin))
+        return pin
+
+    def _commit(self, program, started):
+        claim(self.pi, program.pins)
+        for pin in set(self._pins) - set(program.pins):
+            self.pi.write(pin, OFF)
+        self._pins = program.pins
+        self.committed_channels = program.channels
+        if program.channels and self.store is not None:
+            self.store.clear(COMMITTED)
+
+        self.committed_timing = program.timing
+        self.committed_seq = program.seq
+        self.committed_stats = program.stats
+        self._release(self._committed_ref)
+        self._committed_ref = program.ref
+        self._resumable = None
+
+        self.started = started
+        self._chain = program.chain
         self._chain_idx = 0
-        self._stage_wf(self._chain_idx)
-        self._start_wf()
-
+        self._bounds_saved = False
+        # Checkpointed by the run loop once the next chunk is queued
+        self._last_checkpoint = -math.inf
+
+    def _start_program(self, program):
+        # A program whose waves cannot be created is not left committed
+        # with nothing playing
+        seq = program.seq
+        res = program.timing.resolution
+        try:
+            if not program.channels and self._loopable(seq, res):
+                # Played whole by the DMA engine, so a single chunk
+                program.chain = Chain(seq, [0, len(seq)])
+                self._commit(program, self.clock.time())
+                self._start_loop()
+            else:
+                self._prepare(program)
+                self._commit(program, self.clock.time())
+                logger.debug('Sequence split into chain with '
+                             '{} sub-sequence(s)'.format(len(self._chain)))
+                logger.info('Starting waveform 0')
+                wf, micros, key, _ = program.first
+                self._player.start(wf, micros, key)
+                self._begin(0)
+        except Exception as e:
+            logger.error('Could not start program: {}'.format(e))
+            if self._committed_ref is None:
+                self._release(program.ref)
+            self._halt()
+            raise DriverException('Program could not be started: '
+                                  '{}'.format(e))
+        self._publish_start()
+
+    def _publish_start(self):
+        self.bus.publish('start', {'timing': self.committed_timing.to_dict(),
+                                   'chunks': len(self._chain)})
+
+    def _prepare(self, program):
+        # Split a program and compile its first chunk, unless done already
+        if program.chain is None:
+            program.chain = self._split(program.merged,
+                                        program.timing.resolution,
+                                        self._chunk_cost(program))
+        if program.first is None:
+            program.first = compile_chunk(program.chain[0],
+                                          program.timing.resolution,
+                                          program.pins, self._cache)
+
+    def _stage_next(self, program):
+        # Queue the first waveform of the next program behind the last one
+        # of the playing program, so it starts on the tick this one ends
+        logger.info('Staging queued program {}'.format(program.id))
+        self._prepare(program)
+        claim(self.pi, program.pins)
+        wf, micros, key, _ = program.first
+        self._player.queue(wf, micros, key)
+        self._next = program
+        self._staged_idx = 0
+
+    def enqueue(self, at=None):
+        # Queue the staged program to play after those already queued, or
+        # not before time at
+        with self._cond:
+            if self.staged_timing is None:
+                raise DriverException('No timing staged')
+            if self.staged_seq is None:
+                raise DriverException('No sequence staged')
+            try:
+                at = None if at is None else float(at)
+            except (TypeError, ValueError):
+                raise DriverException('Start time could not be interpreted')
+            program = self._staged_program(at)
+            self._hold(program.ref)
+            self.queue.append(program)
+            self._job_pool.submit(self._precompile, program)
+            self._cond.notify_all()
+        logger.info('Queued program {}'.format(program.id))
+        return program
+
+    def _precompile(self, program):
+        try:
+            self._prepare(program)
+        except Exception as e:
+            logger.error('Could not compile program {}: '
+                         '{}'.format(program.id, e))
+
+    @property
+    def queued(self):
+        # Queued programs in order, starting with the one staged behind the
+        # playing program, if any
+        return ([self._next] if self._next is not None else []) + self.queue
+
+    def dequeue(self, program_id=None):
+        # Remove one queued program, or all of them. A program staged
+        # behind the playing one is already on the DMA engine's queue and
+        # stays there.
+        with self._cond:
+            if program_id is None:
+                removed, self.queue = self.queue, []
+            else:
+                program = self._queued(program_id)
+                if program is self._next:
+                    raise DriverException('Program {} is already '
+                                          'starting'.format(program_id))
+                self.queue.remove(program)
+                removed = [program]
+            for program in removed:
+                self._release(program.ref)
+            self._cond.notify_all()
+
+    def move(self, program_id, index):
+        # Move a queued program to index of the queue as queried, in
+        # front of which nothing can go if its first program is staged
+        with self._cond:
+            program = self._queued(program_id)
+            try:
+                index = int(index)
+            except (TypeError, ValueError):
+                raise DriverException('Queue index could not be '
+                                      'interpreted')
+            others = [p for p in self.queued if p is not program]
+            if index < 0:
+                index = max(index + len(others), 0)
+            index = min(index, len(others))
+
+            staged = int(self._next is not None)
+            if program is self._next and index == 0:
+                return
+            if program is self._next or index < staged:
+                raise DriverException('Program {} is already '
+                                      'starting'.format(self._next.id))
+            queue = others[staged:]
+            queue.insert(index - staged, program)
+            if queue == self.queue:
+                return
+            self.queue = queue
+            self._cond.notify_all()
+
+    def _queued(self, program_id):
+        for program in self.queued:
+            if program.id == program_id:
+                return program
+        raise DriverException('No queued program {}'.format(program_id))
+
+    def resume_seq(self):
+        # Pick a checkpointed program up at the slot wall-clock time says
+        # it should be at. Only the chunk that slot falls in is rebuilt;
+        # the rest of the chain comes from the boundaries saved at start.
+        with self._cond:
+            meta = self._resumable
+            if meta is None:
+                raise DriverException('No program to resume')
+            if self._chain is not None:
+                raise DriverException('Sequence already in progress')
+
+            try:
+                timing, seq = self._load(meta)
+                if digest(seq) != meta['stats']['hash']:
+                    raise ValueError('sequence does not match its digest')
+            except (KeyError, OSError, TypeError, ValueError) as e:
+                # The checkpoint stays, should its files come back
+                logger.error('Could not load program to resume: '
+                             '{}'.format(e))
+                raise DriverException('Program could not be loaded: '
+                                      '{}'.format(e))
+            res = timing.resolution
+            offset = math.ceil((self.clock.time() - meta['started']) / res)
+            if offset < meta['slot']:
+                raise DriverException('Clock is behind the last checkpoint')
+            if offset >= len(seq):
+                self.stop_seq('finish')
+                raise DriverException('Program would have finished')
+            logger.info('Resuming sequence at slot {}'.format(offset))
+
+            program = Program(timing, seq, meta['stats'], meta['sequence'])
+            self._hold(program.ref)
+            try:
+                self._resume(program, meta, offset)
+            except Exception as e:
+                # The checkpoint stays, so resuming can be retried
+                logger.error('Could not resume program: {}'.format(e))
+                if self._committed_ref is None:
+                    self._release(program.ref)
+                self._halt()
+                self._resumable = meta
+                raise DriverException('Program could not be resumed: '
+                                      '{}'.format(e))
+            self._checkpoint(force=True)
+            self.bus.publish('resume', {'timing': timing.to_dict(),
+                                        'slot': offset,
+                                        'chunks': len(self._chain)})
+            self._cond.notify_all()
+
+
+    def _resume(self, program, meta, offset):
+        seq = program.seq
+        res = program.timing.resolution
+        if self._loopable(seq, res) and offset < seq.body:
+            program.chain = Chain(seq, [offset, len(seq)])
+            self._commit(program, meta['started'])
+            self._start_loop(offset)
+        else:
+            saved = self.store.load_bounds(COMMITTED)
+            if saved is None or saved[-1] != len(seq):
+                cost = self._chunk_cost(program)
+                bounds = self._split(seq[offset:], res, cost).bounds + offset
+            else:
+                idx = int(np.searchsorted(saved, offset, 'right')) - 1
+                bounds = np.concatenate(([offset], saved[idx + 1:]))
+            program.chain = Chain(seq, bounds)
+            self._commit(program, meta['started'])
+            # Saved boundaries still cover every later offset
+            self._bounds_saved = saved is not None
+            self._start_wf()
 
     def eta(self):
         if self.started is not None:
@@ -285,8 +1284,11 @@ class Service(BaseService):
 
 
     def chain_progress(self):
-        if self.started is not None:
-            t = time.time() - self.started
+        # How far into the program playback is by the ticks, less the
+        # time lost to chunks that started late
+        origin = self._origin
+        if self.started is not None and origin is not None:
+            t = (self._player.ticks.now() - origin - self._drift) / MICROS
             return min(t / self.committed_timing.adjusted.total, 1.0)
         else:
             return 0.0
@@ -294,18 +1296,79 @@ class Service(BaseService):
     def wf_progress(self):
         try:
             if self._wf_start is not None:
-                t = time.time() - self._wf_start
-                wf_total = len(self._chain[self._chain_idx]) * \
+                t = (self._player.ticks.now() - self._wf_start) / MICROS
+                wf_total = self._chain.span(self._chain_idx) * \
                     self.committed_timing.resolution
                 return min(t / wf_total, 1.0)
-        except AttributeError:
+        except (AttributeError, TypeError):
             pass
         return 0.0
 
+    def drift_stats(self):
+        # Scheduled against measured micros of the chunks played so far,
+        # how far behind its schedule the playing chunk was seen to
+        # start, and how many seconds the system clock gained on the ticks
+        # since the program started
+        origin, wall_origin = self._origin, self._wall_origin
+        skew = None
+        if self.started is not None and origin is not None:
+            skew = self.clock.time() - wall_origin - \
+                (self._player.ticks.now() - origin) / MICROS
+        times = list(self._chunk_times)
+        return {'chunks': self._timed,
+                'scheduled': self._scheduled,
+                'measured': self._measured,
+                'drift': self._drift,
+                'skew': skew,
+                'last': times[-1] if times else None}
+
+    def progress(self):
+        return {'progress': self.chain_progress(),
+                'eta': self.eta(),
+                'started': self.started,
+                'chunk': self._chain_idx,
+                'chunks': len(self._chain) if self._chain else 0}
+
+    def current_chunk(self):
+        # (index, first slot, end slot, chunk) of the playing chunk. A
+        # looped program is one chunk as long as the program, so the
+        # period playing, or the tail, stands in for it.
+        chain, idx = self._chain, self._chain_idx
+        if chain is None:
+            return None
+        start, stop = int(chain.bounds[idx]), int(chain.bounds[idx + 1])
+        if self._player.looping:
+            start, stop = self._playing_period(start, stop)
+            return idx, start, stop, chain.seq[start:stop]
+        chunk = chain[idx]
+        if isinstance(chunk, MergedSequence):
+            chunk = chunk.seqs[0]
+        return idx, start, stop, chunk
+
+    def _playing_period(self, start, stop):
+        # (first slot, end slot) of the period of the looped sequence
+        # playing, clipped to start and stop, or of its tail
+        seq, origin = self.committed_seq, self._origin
+        slot = start
+        if origin is not None:
+            micros = self.committed_timing.resolution * MICROS
+            slot = int((self._player.ticks.now() - origin) // micros)
+            slot = min(max(slot, start), stop - 1)
+        if slot >= seq.body:
+            return max(seq.body, start), stop
+        period = len(seq.unit)
+        first = slot - slot % period
+        return max(first, start), min(first + period, stop)
+
+    def gap_stats(self):
+        return self._player.gap_stats()
+
     def _display(self):
-        t = time.time()
+        t = time.monotonic()
         if t - self._last_disp > DISP_DELAY:
             self._last_disp = t
+            if self._lcd_svc is None:
+                return
 
             prog = self.chain_progress() * 100
             buffer = ['Prog @ {:.3}%'.format(prog)]
@@ -0,0 +1,72 @@
+from itertools import count
+from threading import Event
+import time
+
+
+# Exceptions
+class JobCancelled(Exception):
+    pass
+
+
+# Jobs
+class Job:
+    # A unit of background work. The worker reports progress through the
+    # callbacks handed out by phase(), which is also where a cancellation
+    # takes effect.
+
+    _ids = count(1)
+
+    def __init__(self, kind):
+        self.id = next(Job._ids)
+        self.kind = kind
+        self.state = 'pending'
+        self.progress = 0.0
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self._cancel = Event()
+
+    @property
+    def done(self):
+        return self.state in ('done', 'failed', 'cancelled')
+
+    def cancel(self):
+        if self.done:
+            return False
+        self._cancel.set()
+        return True
+
+    def check(self):
+        if self._cancel.is_set():
+            raise JobCancelled()
+
+    def start(self):
+        self.check()
+        self.state = 'running'
+
+    def phase(self, lo, hi):
+        # Progress callback mapping a phase's fraction done onto [lo, hi]
+        def step(frac):
+            self.check()
+            self.progress = lo + (hi - lo) * frac
+        return step
+
+    def finish(self, state, error=None):
+        self.state = state
+        self.error = error
+        if state == 'done':
+            self.progress = 1.0
+        self.finished = time.time()
+
+    def to_dict(self):
+        return {'id': self.id,
+                'kind': self.kind,
+                'state': self.state,
+                'progress': self.progress,
+                'error': self.error,
+                'created': self.created,
+                'finished': self.finished}
+
+    def __repr__(self):
+        fstr = 'Job(id={}, kind={}, state={}, progress={:.3})'
+        return fstr.format(self.id, self.kind, self.state, self.progress)
@@ -3,10 +3,11 @@ from enum import Enum
 import time
 import queue
 
-import pigpio
 from RPLCD.pigpio import CharLCD
 
 from pittld import logger
+from pittld.backend import (connect, LCD_CONTRAST, LCD_DATA, LCD_E,
+                             LCD_RS, LCD_RW)
 from pittld.svc import BaseService
 
 
@@ -14,23 +15,19 @@ from pittld.svc import BaseService
 DELAY = 5
 
 
-# Initialize lcd
-pi = pigpio.pi()
-
-
 # Service
 class Service(BaseService):
 
-    def __init__(self):
+    def __init__(self, pi=None):
         super().__init__()
         self.name = 'lcd'
 
-        self._lcd = CharLCD(pi,
-                           pin_rs=15,
-                           pin_rw=18,
-                           pin_e=16,
-                           pins_data=[21, 22, 23, 24],
-                           pin_contrast=17,
+        self._lcd = CharLCD(connect() if pi is None else pi,
+                           pin_rs=LCD_RS,
+                           pin_rw=LCD_RW,
+                           pin_e=LCD_E,
+                           pins_data=list(LCD_DATA),
+                           pin_contrast=LCD_CONTRAST,
                            cols=16, rows=2)
 
         self._row = [queue.Queue(), queue.Queue()]
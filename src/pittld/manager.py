@@ -1,98 +1,494 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import pickle
-import socket
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 from pittld import logger
+from pittld import protocol
 from pittld.driver import DriverException
+from pittld.metrics import prometheus, Registry
+from pittld.protocol import ProtocolException
 from pittld.shared import PORT, Response, Request
 from pittld.svc import BaseService
 
 
 # Constants
 HOST = '0.0.0.0'
+METRICS_HOST = '127.0.0.1'
 BLOCK_SZ = 1024
+FRAME_BLOCK_SZ = 1 << 16
+BACKLOG = 16
+WORKERS = 2
+MAX_RANGE = 1 << 24
 
+# Subscribers further behind than this miss progress events
+MAX_PENDING = 1 << 16
 
-# Service
-class Service(BaseService):
+# Accept bare pickled requests from older pittl-client installs. Off unless
+# asked for, as unpickling a request can run arbitrary code.
+LEGACY_PICKLE = False
 
-    def __init__(self, driver_svc):
-        super().__init__()
-        self.name = 'manager'
+# Requests whose handling may take a while, run off the event loop. That
+# includes every request taking the driver's lock, which a program being
+# split and compiled can hold for seconds.
+SLOW_REQUESTS = {Request.STAGE_TIMING,
+                 Request.STAGE_SEQUENCE_RANDOM,
+                 Request.STAGE_SEQUENCE_SEEDED,
+                 Request.STAGE_SEQUENCE_REGULAR,
+                 Request.START_SEQUENCE,
+                 Request.RESUME_SEQUENCE,
+                 Request.STOP_SEQUENCE,
+                 Request.QUERY_SEQUENCE,
+                 Request.QUERY_RANGE,
+                 Request.QUERY_CHUNK,
+                 Request.ENQUEUE,
+                 Request.DEQUEUE,
+                 Request.MOVE_QUEUE,
+                 Request.STAGE_CHANNEL,
+                 Request.CLEAR_CHANNEL,
+                 Request.STAGE_JOB,
+                 Request.CANCEL_JOB}
 
-        # CLI
-        self.client = None
 
-        # Driver mirror
-        self.driver_svc = driver_svc
+# Low-level routines
+def compressor(name):
+    if name is None:
+        return None
+    elif name == 'zlib':
+        return zlib.compressobj()
+    elif name == 'zstd' and zstandard is not None:
+        return zstandard.ZstdCompressor().compressobj()
+    raise ValueError('Unsupported compression {}'.format(name))
+
+
+def packed_chunks(seq, compression=None):
+    # The sequence bit-packed (MSB first), a block at a time
+    c = compressor(compression)
+    for _, block in seq.blocks():
+        b = block.packed()
+        if c is not None:
+            b = c.compress(b)
+        if len(b):
+            yield b
+    if c is not None:
+        yield c.flush()
+
+
+# Subscriptions
+class Subscription:
+
+    def __init__(self, client, rid, interval):
+        self.client = client
+        self.rid = rid
+        self.interval = interval
+        self.last = 0
+
+
+# Connections
+class PickleClient:
+    # Legacy protocol: one pickled (msg, data) per recv, answered in order
+    framed = False
+
+    def __init__(self, reader, writer, metrics):
+        self.reader = reader
+        self.writer = writer
+        self.addr = writer.get_extra_info('peername')
+        self._sent = metrics.counter('response_bytes_total',
+                                     'Bytes of responses sent', kind='reply')
+        self._streamed = metrics.counter('response_bytes_total',
+                                         'Bytes of responses sent',
+                                         kind='stream')
+
+    def serialize(self, data):
+        return pickle.dumps(data)
 
-    def respond(self, msg, data=None):
+    async def respond(self, msg, data=None, rid=None):
         event = (msg.value, data)
 
         b = pickle.dumps(event)
-        try:
-            self.client.send(b)
-            logger.debug('Responded {}'.format(event))
-        except socket.error:
-            pass
+        self._sent.inc(len(b))
+        self.writer.write(b)
+        await self.writer.drain()
+        logger.debug('Responded {} to {}:{}'.format(event, *self.addr[:2]))
 
-    def stream_response(self, data):
-        b = pickle.dumps(data)
+    async def stream_response(self, b, rid=None):
         m = len(b)
         n = round(m / BLOCK_SZ - 0.5) + int((m % BLOCK_SZ) > 0)
 
         # Header
-        self.respond(Response.STREAM, n)
+        await self.respond(Response.STREAM, n)
 
         # Body
-        try:
-            idx = 0
-            while idx < m:
-                self.client.send(b[idx:min(idx + BLOCK_SZ, m)])
-                idx += BLOCK_SZ
-            return (Response.SUCCESS, None)
-        except socket.error:
-            return (Response.FAILURE, None)
+        self._streamed.inc(m)
+        idx = 0
+        while idx < m:
+            self.writer.write(b[idx:min(idx + BLOCK_SZ, m)])
+            await self.writer.drain()
+            idx += BLOCK_SZ
 
-    def run(self):
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.bind((HOST, PORT))
-            s.listen(0)
-            addr = s.getsockname()
-            logger.info('Awaiting connection on {}:{}'.format(*addr))
+    async def serve(self, svc, head):
+        data = head
+        while True:
+            # Get a msg please
+            data += await self.reader.read(1024 - len(data))
+            if not data:
+                return
+            try:
+                event = pickle.loads(data)
+                logger.debug('Received {}'.format(event))
+            except (pickle.UnpicklingError, EOFError):
+                logger.error('Deserialization error')
+                await self.respond(Response.FAILURE, 'Deserialization error')
+                continue
+            finally:
+                data = b''
 
-            self.await_client(s)
+            await svc.handle_request(self, None, *event)
 
-    def await_client(self, s):
-        while True:
-            client, addr = s.accept()
-            self.client = client
 
-            logger.info('Accepted connection from {}:{}'.format(*addr))
-            self.handle_client(client, addr)
-            logger.info('{}:{} disconnected'.format(*addr))
+class FramedClient:
+    # Length-prefixed protocol.py frames. Requests carry ids and are
+    # handled concurrently; each response frame echoes its request's id.
+    framed = True
+
+    def __init__(self, reader, writer, metrics):
+        self.reader = reader
+        self.writer = writer
+        self.addr = writer.get_extra_info('peername')
+        self._sent = metrics.counter('response_bytes_total',
+                                     'Bytes of responses sent', kind='reply')
+        self._streamed = metrics.counter('response_bytes_total',
+                                         'Bytes of responses sent',
+                                         kind='stream')
+        self._pushed = metrics.counter('response_bytes_total',
+                                       'Bytes of responses sent',
+                                       kind='event')
 
-    def handle_client(self, client, addr):
-        with client:
+    def serialize(self, data):
+        return protocol.encode(data)
+
+    async def respond(self, msg, data=None, rid=0):
+        b = protocol.pack_message(rid, msg, data)
+        self._sent.inc(len(b))
+        self.writer.write(b)
+        await self.writer.drain()
+        logger.debug('Responded {} to {}:{} '
+                     '(request {})'.format((msg.value, data),
+                                           *self.addr[:2], rid))
+
+    async def stream_response(self, b, rid=0):
+        view = memoryview(b)
+        for idx in range(0, len(view), FRAME_BLOCK_SZ):
+            block = protocol.pack_message(rid, Response.STREAM,
+                                          view[idx:idx + FRAME_BLOCK_SZ])
+            self._streamed.inc(len(block))
+            self.writer.write(block)
+            await self.writer.drain()
+
+    def push(self, rid, payload):
+        b = protocol.pack_encoded(rid, Response.EVENT, payload)
+        self._pushed.inc(len(b))
+        self.writer.write(b)
+
+    def backlog(self):
+        return self.writer.transport.get_write_buffer_size()
+
+    async def send_bytes(self, msg, b, rid=0):
+        header = protocol.pack_bytes_header(rid, msg, len(b))
+        self._streamed.inc(len(header) + len(b))
+        self.writer.write(header)
+        self.writer.write(memoryview(b))
+        await self.writer.drain()
+
+    async def serve(self, svc, head):
+        tasks = set()
+        try:
             while True:
-                # Get a msg please
-                try:
-                    data = client.recv(1024)
-                except ConnectionResetError:
-                    return
-                if not data:
+                body = await protocol.read_frame(self.reader, head)
+                head = b''
+                if body is None:
                     return
                 try:
-                    event = pickle.loads(data)
-                    logger.debug('Received {}'.format(event))
+                    rid, msg, data = protocol.unpack_message(body)
+                    logger.debug('Received {} '
+                                 '(request {})'.format((msg, data), rid))
+                except ProtocolException as e:
+                    logger.error('Deserialization error: {}'.format(e))
+                    await self.respond(Response.FAILURE,
+                                       'Deserialization error')
+                    continue
+
+                task = asyncio.ensure_future(
+                    svc.handle_request(self, rid, msg, data))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            svc.unsubscribe(self)
+            for task in tasks:
+                task.cancel()
+
+
+# Service
+class Service(BaseService):
+
+    def __init__(self, driver_svc, host=HOST, port=PORT,
+                 legacy=LEGACY_PICKLE, metrics_port=None):
+        super().__init__()
+        self.name = 'manager'
+
+        # Driver mirror
+        self.driver_svc = driver_svc
+
+        self.host = host
+        self.port = port
+        self.address = None
+        self.legacy = legacy
+
+        # Prometheus text exposition of the metrics, on localhost only
+        self.metrics_port = metrics_port
+        self.metrics_address = None
+
+        self._executor = ThreadPoolExecutor(max_workers=WORKERS)
+
+        # Program events are fanned out to subscribed clients
+        self._loop = None
+        self._subscriptions = []
+        driver_svc.bus.subscribe(self._on_event)
+
+        self._clients = set()
+        self.metrics = Registry('pittld_manager')
+        self.metrics.gauge('connections', 'Connected clients',
+                           lambda: len(self._clients))
+        self.metrics.gauge('subscriptions', 'Event subscriptions',
+                           lambda: len(self._subscriptions))
+        self.metrics.gauge('write_backlog_bytes',
+                           'Bytes buffered for framed clients',
+                           lambda: sum(c.backlog()
+                                       for c in list(self._clients)
+                                       if c.framed))
+
+    def run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        self._loop = loop
+        loop.run_until_complete(self.serve())
+
+    def _on_event(self, event, data):
+        # Runs on the publishing thread
+        if self._loop is not None and self._subscriptions:
+            self._loop.call_soon_threadsafe(self._fan_out, event, data)
+
+    def _fan_out(self, event, data):
+        payload = protocol.encode({'event': event, 'data': data})
+        now = time.monotonic()
+        for sub in self._subscriptions:
+            if event == 'progress':
+                if now - sub.last < sub.interval or \
+                        sub.client.backlog() > MAX_PENDING:
+                    continue
+                sub.last = now
+            sub.client.push(sub.rid, payload)
+
+    def subscribe(self, client, rid, data):
+        if not client.framed:
+            return (Response.FAILURE, 'Subscriptions need the framed protocol')
+        try:
+            interval = float((data or {}).get('interval', 0))
+        except (AttributeError, TypeError, ValueError):
+            return (Response.FAILURE, 'Subscription could not be interpreted')
+
+        self._subscriptions.append(Subscription(client, rid, interval))
+        logger.info('{}:{} subscribed'.format(*client.addr[:2]))
+        return (Response.SUCCESS, self.driver_svc.progress())
+
+    def unsubscribe(self, client):
+        self._subscriptions = [x for x in self._subscriptions
+                               if x.client is not client]
+        return (Response.SUCCESS, None)
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle_client,
+                                            self.host, self.port,
+                                            backlog=BACKLOG)
+        addr = server.sockets[0].getsockname()
+        self.address = addr
+        logger.info('Awaiting connections on {}:{}'.format(*addr))
+
+        if self.metrics_port is not None:
+            exporter = await asyncio.start_server(self.handle_scrape,
+                                                  METRICS_HOST,
+                                                  self.metrics_port)
+            self.metrics_address = exporter.sockets[0].getsockname()
+            logger.info('Serving metrics on '
+                        'http://{}:{}/metrics'.format(*self.metrics_address))
+
+        async with server:
+            await server.serve_forever()
+
+    async def handle_scrape(self, reader, writer):
+        # A minimal HTTP/1.0 responder: whatever the path, answers with
+        # the metrics in the Prometheus text format and closes
+        try:
+            while (await reader.readline()).strip():
+                pass
+            body = self.prometheus().encode()
+            writer.write(b'HTTP/1.0 200 OK\r\n'
+                         b'Content-Type: text/plain; version=0.0.4\r\n'
+                         b'Content-Length: ' + str(len(body)).encode() +
+                         b'\r\n\r\n' + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def prometheus(self):
+        return prometheus(self.metrics, self.driver_svc.metrics)
 
-                    rsp = self.dispatch(*event)
-                    self.respond(*rsp)
+    async def handle_client(self, reader, writer):
+        addr = writer.get_extra_info('peername')
+        logger.info('Accepted connection from {}:{}'.format(*addr[:2]))
 
-                except pickle.UnpicklingError:
-                    logger.error('Deserialization error')
-                    self.respond(Response.FAILURE,
-                                 'Deserialization error')
+        try:
+            # The first byte tells legacy pickles from frames
+            head = await reader.read(1)
+            if not head:
+                pass
+            elif head[0] == protocol.PICKLE_PROTO:
+                if self.legacy:
+                    client = PickleClient(reader, writer, self.metrics)
+                    await self._serve(client, head)
+                else:
+                    logger.error('Refused legacy pickle client')
+            else:
+                client = FramedClient(reader, writer, self.metrics)
+                await self._serve(client, head)
+        except (ConnectionError, EOFError):
+            pass
+        except ProtocolException as e:
+            logger.error('Protocol error: {}'.format(e))
+        finally:
+            writer.close()
+            logger.info('{}:{} disconnected'.format(*addr[:2]))
+
+    async def _serve(self, client, head):
+        self._clients.add(client)
+        try:
+            await client.serve(self, head)
+        finally:
+            self._clients.discard(client)
+
+    async def handle_request(self, client, rid, msg, data):
+        t = time.perf_counter()
+        try:
+            await self._handle_request(client, rid, msg, data)
+        except ConnectionError:
+            raise
+        except Exception as e:
+            # Answered rather than left to kill the task, so the client
+            # is not kept waiting for a response that never comes
+            logger.error('Request {} failed: {!r}'.format(msg, e))
+            await client.respond(Response.FAILURE,
+                                 'Request failed: {}'.format(e), rid=rid)
+        finally:
+            try:
+                name = Request(msg).name
+            except ValueError:
+                name = 'UNKNOWN'
+            self.metrics.histogram('request_seconds',
+                                   'Time to answer a request',
+                                   request=name).observe(
+                time.perf_counter() - t)
+
+    async def _handle_request(self, client, rid, msg, data):
+        if msg == Request.QUERY_SEQUENCE and client.framed:
+            rsp = await self.stream_sequence(client, rid, data)
+            await client.respond(*rsp, rid=rid)
+            return
+        if msg == Request.SUBSCRIBE:
+            await client.respond(*self.subscribe(client, rid, data), rid=rid)
+            return
+        if msg == Request.UNSUBSCRIBE:
+            await client.respond(*self.unsubscribe(client), rid=rid)
+            return
+
+        rsp = await self.dispatch_async(msg, data)
+        if rsp[0] == Response.STREAM:
+            loop = asyncio.get_running_loop()
+            b = await loop.run_in_executor(self._executor,
+                                           client.serialize, rsp[1])
+            await client.stream_response(b, rid)
+            rsp = (Response.SUCCESS, None)
+        await client.respond(*rsp, rid=rid)
+
+    async def dispatch_async(self, msg, data):
+        if msg in SLOW_REQUESTS:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor,
+                                              self.dispatch, msg, data)
+        return self.dispatch(msg, data)
+
+    async def stream_sequence(self, client, rid, options):
+        # A STREAM header describing the sequences, then for each present
+        # sequence its packed bytes as STREAM frames ended by an empty one
+        # Sequences whose digest matches the client's copy are skipped
+        options = options or {}
+        compression = options.get('compression')
+        try:
+            compressor(compression)
+        except ValueError as e:
+            return (Response.FAILURE, str(e))
+
+        digests = self.digests()
+        cached = self.cached_digests(options)
+        if cached == digests:
+            return (Response.UNCHANGED, None)
+
+        seqs = [('staged', self.driver_svc.staged_seq),
+                ('committed', self.driver_svc.committed_seq)]
+        header = {'encoding': 'packbits', 'compression': compression}
+        for name, seq in seqs:
+            if seq is None:
+                header[name] = None
+            else:
+                header[name] = {'length': len(seq),
+                                'digest': digests[name],
+                                'unchanged': cached.get(name) == digests[name]}
+        await client.respond(Response.STREAM, header, rid)
+
+        loop = asyncio.get_running_loop()
+        for name, seq in seqs:
+            if seq is None or header[name]['unchanged']:
+                continue
+            chunks = packed_chunks(seq, compression)
+            while True:
+                b = await loop.run_in_executor(self._executor,
+                                               next, chunks, None)
+                if b is None:
+                    break
+                await client.send_bytes(Response.STREAM, b, rid)
+            await client.send_bytes(Response.STREAM, b'', rid)
+        return (Response.SUCCESS, None)
+
+    def digests(self):
+        stats = {'staged': self.driver_svc.staged_stats,
+                 'committed': self.driver_svc.committed_stats}
+        return {k: v and v['hash'] for k, v in stats.items()}
+
+    def cached_digests(self, data):
+        # The digests a client sent as if_none_match, if any
+        try:
+            cached = data['if_none_match']
+        except (KeyError, TypeError):
+            return {}
+        return cached if isinstance(cached, dict) else {}
 
     def query_timing(self):
         if self.driver_svc.staged_timing is None:
@@ -104,13 +500,69 @@ class Service(BaseService):
         else:
             c = self.driver_svc.committed_timing.to_dict()
 
-        t = {'timing': {'staged': s, 'committed': c}}
+        t = {'timing': {'staged': s, 'committed': c},
+             'digest': self.digests()}
         return (Response.SUCCESS, t)
 
-    def query_sequence(self):
-        s = {'sequence': {'staged': self.driver_svc.staged_seq,
-                          'committed': self.driver_svc.committed_seq}}
-        return self.stream_response(s)
+    def query_sequence(self, data=None):
+        # Legacy clients expect plain lists of logic levels
+        if self.cached_digests(data) == self.digests():
+            return (Response.UNCHANGED, None)
+
+        staged = self.driver_svc.staged_seq
+        if staged is not None:
+            staged = staged.tolist()
+        committed = self.driver_svc.committed_seq
+        if committed is not None:
+            committed = committed.tolist()
+
+        s = {'sequence': {'staged': staged, 'committed': committed},
+             'digest': self.digests()}
+        return (Response.STREAM, s)
+
+    def query_range(self, data):
+        try:
+            which = data.get('which', 'staged')
+            start, stop = int(data['start']), int(data['stop'])
+            seq = {'staged': self.driver_svc.staged_seq,
+                   'committed': self.driver_svc.committed_seq}[which]
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return (Response.FAILURE, 'Range could not be interpreted')
+        if seq is None:
+            return (Response.FAILURE, 'No {} sequence'.format(which))
+        if not 0 <= start <= stop <= len(seq):
+            return (Response.FAILURE, 'Range out of bounds')
+        if stop - start > MAX_RANGE:
+            return (Response.FAILURE, 'Range longer than '
+                                      '{} slots'.format(MAX_RANGE))
+
+        r = {'range': {'which': which,
+                       'start': start,
+                       'stop': stop,
+                       'bits': bytes(seq[start:stop].packed())}}
+        return (Response.SUCCESS, r)
+
+    def query_chunk(self):
+        chunk = self.driver_svc.current_chunk()
+        if chunk is None:
+            return (Response.SUCCESS, {'chunk': {}})
+
+        idx, start, stop, seq = chunk
+        if stop - start > MAX_RANGE:
+            stop = start + MAX_RANGE
+            seq = seq[:MAX_RANGE]
+        c = {'chunk': {'index': idx,
+                       'start': start,
+                       'stop': stop,
+                       'bits': bytes(seq.packed())}}
+        return (Response.SUCCESS, c)
+
+    def query_summary(self):
+        s = self.driver_svc.staged_stats or {}
+        c = self.driver_svc.committed_stats or {}
+
+        d = {'summary': {'staged': s, 'committed': c}}
+        return (Response.SUCCESS, d)
 
     def query_program(self):
         progress = self.driver_svc.chain_progress()
@@ -127,7 +579,75 @@ class Service(BaseService):
 
         d = {'program': {'progress': progress,
                          'eta': eta,
-                         'started': started}}
+                         'started': started,
+                         'gaps': self.driver_svc.gap_stats(),
+                         'drift': self.driver_svc.drift_stats(),
+                         'chunking': self.driver_svc.chunking(),
+                         'resumable': self.driver_svc.resumable()}}
+        return (Response.SUCCESS, d)
+
+    def stage_job(self, data):
+        # data: {'kind': 'random' | 'seeded' | 'regular', 'seed': seed,
+        # 'timing': (total, exposure_frac, resolution)}, seed and timing
+        # optional. Answers with the job as soon as it is queued.
+        if not isinstance(data, dict):
+            return (Response.FAILURE, 'Staging job could not be interpreted')
+        try:
+            job = self.driver_svc.submit_stage(data.get('kind'),
+                                               data.get('seed'),
+                                               data.get('timing'))
+        except DriverException as e:
+            return (Response.FAILURE, str(e))
+        return (Response.SUCCESS, job.to_dict())
+
+    def query_job(self, data=None):
+        # One job by id, or all remembered jobs
+        if data is None:
+            return (Response.SUCCESS,
+                    [job.to_dict() for job in self.driver_svc.jobs()])
+        try:
+            return (Response.SUCCESS, self.driver_svc.job(data).to_dict())
+        except DriverException as e:
+            return (Response.FAILURE, str(e))
+
+    def enqueue(self, data=None):
+        # data: {'at': start time as a POSIX timestamp}, optional. Queues
+        # the staged program; queued programs start as soon as the driver
+        # is free and their start time has come, back to back with the
+        # program before them. Stopping a program moves on to the next.
+        at = data.get('at') if isinstance(data, dict) else None
+        try:
+            program = self.driver_svc.enqueue(at)
+        except DriverException as e:
+            return (Response.FAILURE, str(e))
+        return (Response.SUCCESS, program.to_dict())
+
+    def query_queue(self):
+        return (Response.SUCCESS,
+                [program.to_dict() for program in self.driver_svc.queued])
+
+    def move_queued(self, data):
+        # data: (program id, new index)
+        try:
+            program_id, index = data
+        except (TypeError, ValueError):
+            return (Response.FAILURE, 'Queue move could not be interpreted')
+        try:
+            self.driver_svc.move(program_id, index)
+        except DriverException as e:
+            return (Response.FAILURE, str(e))
+        return self.query_queue()
+
+    def query_channels(self):
+        staged = self.driver_svc.staged_channels
+        d = {'staged': [staged[pin].to_dict() for pin in sorted(staged)],
+             'committed': [c.to_dict()
+                           for c in self.driver_svc.committed_channels]}
+        return (Response.SUCCESS, d)
+
+    def query_metrics(self):
+        d = {'manager': self.metrics.snapshot(),
+             'driver': self.driver_svc.metrics.snapshot()}
         return (Response.SUCCESS, d)
 
     def dispatch(self, msg, data):
@@ -139,7 +659,13 @@ class Service(BaseService):
                 return (Response.FAILURE, str(e))
         elif msg == Request.STAGE_SEQUENCE_RANDOM:
             try:
-                self.driver_svc.stage_seq_rand()
+                self.driver_svc.stage_seq_rand(data)
+                return (Response.SUCCESS, None)
+            except DriverException as e:
+                return (Response.FAILURE, str(e))
+        elif msg == Request.STAGE_SEQUENCE_SEEDED:
+            try:
+                self.driver_svc.stage_seq_seeded(data)
                 return (Response.SUCCESS, None)
             except DriverException as e:
                 return (Response.FAILURE, str(e))
@@ -155,6 +681,12 @@ class Service(BaseService):
                 return (Response.SUCCESS, None)
             except DriverException as e:
                 return (Response.FAILURE, str(e))
+        elif msg == Request.RESUME_SEQUENCE:
+            try:
+                self.driver_svc.resume_seq()
+                return (Response.SUCCESS, None)
+            except DriverException as e:
+                return (Response.FAILURE, str(e))
         elif msg == Request.STOP_SEQUENCE:
             try:
                 self.driver_svc.stop_seq()
@@ -164,8 +696,52 @@ class Service(BaseService):
         elif msg == Request.QUERY_TIMING:
             return self.query_timing()
         elif msg == Request.QUERY_SEQUENCE:
-            return self.query_sequence()
+            return self.query_sequence(data)
         elif msg == Request.QUERY_PROGRAM:
             return self.query_program()
+        elif msg == Request.QUERY_RANGE:
+            return self.query_range(data)
+        elif msg == Request.QUERY_CHUNK:
+            return self.query_chunk()
+        elif msg == Request.QUERY_SUMMARY:
+            return self.query_summary()
+        elif msg == Request.ENQUEUE:
+            return self.enqueue(data)
+        elif msg == Request.QUERY_QUEUE:
+            return self.query_queue()
+        elif msg == Request.DEQUEUE:
+            try:
+                self.driver_svc.dequeue(data)
+            except DriverException as e:
+                return (Response.FAILURE, str(e))
+            return self.query_queue()
+        elif msg == Request.MOVE_QUEUE:
+            return self.move_queued(data)
+        elif msg == Request.STAGE_CHANNEL:
+            try:
+                self.driver_svc.stage_channel(data)
+            except DriverException as e:
+                return (Response.FAILURE, str(e))
+            return self.query_channels()
+        elif msg == Request.CLEAR_CHANNEL:
+            try:
+                self.driver_svc.clear_channel(data)
+            except DriverException as e:
+                return (Response.FAILURE, str(e))
+            return self.query_channels()
+        elif msg == Request.QUERY_CHANNELS:
+            return self.query_channels()
+        elif msg == Request.QUERY_METRICS:
+            return self.query_metrics()
+        elif msg == Request.STAGE_JOB:
+            return self.stage_job(data)
+        elif msg == Request.QUERY_JOB:
+            return self.query_job(data)
+        elif msg == Request.CANCEL_JOB:
+            try:
+                self.driver_svc.cancel_job(data)
+                return (Response.SUCCESS, None)
+            except DriverException as e:
+                return (Response.FAILURE, str(e))
         else:
             return (Response.FAILURE, 'Unknown request')
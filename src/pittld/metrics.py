@@ -0,0 +1,155 @@
+from bisect import bisect_left
+from threading import Lock
+
+
+# Bucket upper bounds: durations from a microsecond to about two minutes,
+# and tick counts from 0 to about 16 seconds, doubling each time
+SECONDS = tuple(1e-6 * 2 ** k for k in range(28))
+TICKS = (0,) + tuple(2 ** k for k in range(25))
+
+
+# Metrics
+class Counter:
+
+    kind = 'counter'
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n=1):
+        self.value += n
+
+    def sample(self):
+        return self.value
+
+
+class Gauge:
+    # A value that is set, or read from fcn whenever it is sampled
+
+    kind = 'gauge'
+
+    def __init__(self, fcn=None):
+        self.value = 0
+        self._fcn = fcn
+
+    def set(self, value):
+        self.value = value
+
+    def sample(self):
+        return self._fcn() if self._fcn is not None else self.value
+
+
+class Histogram:
+    # Counts of observations at or below each bound. Observing is a
+    # bisection and two additions, cheap enough for every chunk and
+    # request; the cumulative counts are only built when sampled.
+
+    kind = 'histogram'
+
+    def __init__(self, bounds=SECONDS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def sample(self):
+        buckets = []
+        total = 0
+        for bound, n in zip(self.bounds + (float('inf'),), self.counts):
+            total += n
+            buckets.append((bound, total))
+        return {'count': total, 'sum': self.sum, 'buckets': buckets}
+
+
+# Registry
+class Registry:
+    # Named metrics of one service, each with a series per set of label
+    # values. Metrics are created on first use and kept for good.
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self._metrics = {}
+        self._lock = Lock()
+
+    def _get(self, cls, name, help, labels, *args):
+        key = tuple(sorted(labels.items()))
+        try:
+            return self._metrics[name][2][key]
+        except KeyError:
+            pass
+        with self._lock:
+            _, _, series = self._metrics.setdefault(name, (cls, help, {}))
+            if key not in series:
+                series[key] = cls(*args)
+            return series[key]
+
+    def counter(self, name, help, **labels):
+        return self._get(Counter, name, help, labels)
+
+    def gauge(self, name, help, fcn=None, **labels):
+        return self._get(Gauge, name, help, labels, fcn)
+
+    def histogram(self, name, help, bounds=SECONDS, **labels):
+        return self._get(Histogram, name, help, labels, bounds)
+
+    def snapshot(self):
+        # {name: {'type', 'help', 'series': [{'labels', 'value'}]}}
+        with self._lock:
+            metrics = [(name, cls, help, list(series.items()))
+                       for name, (cls, help, series) in self._metrics.items()]
+        return {name: {'type': cls.kind,
+                       'help': help,
+                       'series': [{'labels': dict(key), 'value': m.sample()}
+                                  for key, m in series]}
+                for name, cls, help, series in metrics}
+
+
+# Exposition
+def _labels(labels, **extra):
+    items = list(labels.items()) + list(extra.items())
+    if not items:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, _escape(v))
+                          for k, v in items) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def _number(x):
+    if x == float('inf'):
+        return '+Inf'
+    return repr(x) if isinstance(x, float) else str(x)
+
+
+def prometheus(*registries):
+    # Snapshots of registries in the Prometheus text exposition format
+    lines = []
+    for registry in registries:
+        for name, metric in registry.snapshot().items():
+            name = '{}_{}'.format(registry.prefix, name)
+            lines.append('# HELP {} {}'.format(name, metric['help']))
+            lines.append('# TYPE {} {}'.format(name, metric['type']))
+            for s in metric['series']:
+                labels, value = s['labels'], s['value']
+                if metric['type'] != 'histogram':
+                    lines.append('{}{} {}'.format(name, _labels(labels),
+                                                  _number(value)))
+                    continue
+                for bound, n in value['buckets']:
+                    lines.append('{}_bucket{} {}'.format(
+                        name, _labels(labels, le=_number(bound)), n))
+                lines.append('{}_sum{} {}'.format(name, _labels(labels),
+                                                  _number(value['sum'])))
+                lines.append('{}_count{} {}'.format(name, _labels(labels),
+                                                    value['count']))
+    return '\n'.join(lines) + '\n'
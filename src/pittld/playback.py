@@ -0,0 +1,275 @@
+from collections import deque, OrderedDict
+from threading import Lock
+
+import pigpio
+
+from pittld import logger
+from pittld.backend import clock_of
+from pittld.metrics import Registry, TICKS
+
+
+# Constants
+PAD = 50
+LIVE_WAVES = 100 // PAD
+GAP_HISTORY = 100
+MAX_LOOP = 0xffff
+MICROS = 1e6
+TICK_WRAP = 1 << 32
+
+
+# Low-level routines
+def repeat_chain(block, count):
+    # wave_chain loop counts are 16 bit, larger counts nest loops
+    if count <= 0:
+        return []
+    if count == 1:
+        return list(block)
+    if count > MAX_LOOP:
+        q, r = divmod(count, MAX_LOOP)
+        return repeat_chain(repeat_chain(block, MAX_LOOP), q) + \
+            repeat_chain(block, r)
+    return [255, 0] + list(block) + [255, 1, count & 0xff, count >> 8]
+
+
+def length(wf):
+    # Micros a waveform lasts
+    return sum(p.delay for p in wf)
+
+
+# Ticks
+class Ticks:
+    # pigpio's microsecond tick, unwrapped into micros since the Ticks
+    # were created. The tick wraps every 71 minutes, so a monotonic clock
+    # tells how many times it did between two reads, however far apart.
+
+    def __init__(self, pi):
+        self._pi = pi
+        self._clock = clock_of(pi)
+        self._lock = Lock()
+        self._tick = pi.get_current_tick()
+        self._t = self._clock.perf_counter()
+        self._micros = 0
+
+    def now(self):
+        with self._lock:
+            tick = self._pi.get_current_tick()
+            t = self._clock.perf_counter()
+            diff = (tick - self._tick) % TICK_WRAP
+            wraps = round(((t - self._t) * MICROS - diff) / TICK_WRAP)
+            self._micros += diff + max(wraps, 0) * TICK_WRAP
+            self._tick = tick
+            self._t = t
+            return self._micros
+
+
+# Engine
+class Player:
+    # Plays waveforms back to back. Each wave is created while the one
+    # before it is still transmitting and queued behind it with
+    # ONE_SHOT_SYNC, so the DMA engine moves from one to the next without
+    # software in the loop. Waves are padded to half of pigpio's resources
+    # so the two in flight never starve each other, and a wave is only
+    # deleted once transmission has moved past it. Waves are timed in
+    # ticks, so handoffs are due when the hardware says, whatever the
+    # system clock does meanwhile.
+    #
+    # A wave that played a chunk with a content key is kept, idle, while
+    # pigpio has room for it, and sent again the next time a chunk with
+    # that key comes round, rather than created afresh.
+
+    def __init__(self, pi, metrics=None):
+        self._pi = pi
+        self._clock = clock_of(pi)
+        self.ticks = Ticks(pi)
+
+        # (wave id, start tick, length in micros, content key)
+        self._playing = None
+        self._queued = None
+
+        # Idle wave ids by content key, least recently played first
+        self._idle = OrderedDict()
+        self.reused = 0
+
+        # Wave ids of a looped chain, if one is playing, and its (start
+        # tick, length in micros)
+        self._looped = []
+        self._loop_span = None
+
+        # The tick advance() last saw transmission move on to the queued
+        # wave on, or the playing wave was sent on, which is when a
+        # handoff is known to have happened rather than due to
+        self.seen = None
+
+        self.gaps = deque(maxlen=GAP_HISTORY)
+        self.handoffs = 0
+        self.max_gap = 0
+
+        metrics = Registry('pittld_player') if metrics is None else metrics
+        self._add_time = metrics.histogram(
+            'wave_add_seconds', 'Time spent in wave_add_generic')
+        self._create_time = metrics.histogram(
+            'wave_create_seconds', 'Time spent creating waves')
+        self._gap_ticks = metrics.histogram(
+            'handoff_gap_ticks', 'Micros between a wave ending and the '
+            'next one queued behind it starting', TICKS)
+        self._reuses = metrics.counter(
+            'wave_reuses_total', 'Waves sent again rather than created')
+
+    def _create(self, wf, pad=True):
+        t0 = self._clock.perf_counter()
+        self._pi.wave_add_generic(wf)
+        t1 = self._clock.perf_counter()
+        try:
+            if pad:
+                wid = self._pi.wave_create_and_pad(PAD)
+            else:
+                wid = self._pi.wave_create()
+        except pigpio.error:
+            # Or the pulses would be added to the next wave's
+            self._pi.wave_add_new()
+            raise
+        self._create_time.observe(self._clock.perf_counter() - t1)
+        self._add_time.observe(t1 - t0)
+        return wid
+
+    def _wave(self, wf, key):
+        # (wave id, whether it was created): the idle wave last played
+        # for key, or a new one, for which idle waves make room
+        wid = self._idle.pop(key, None) if key is not None else None
+        if wid is not None:
+            self.reused += 1
+            self._reuses.inc()
+            return wid, False
+        live = sum(w is not None for w in (self._playing, self._queued))
+        while self._idle and live + len(self._idle) >= LIVE_WAVES:
+            self._pi.wave_delete(self._idle.popitem(last=False)[1])
+        return self._create(wf), True
+
+    def _retire(self, wid, key):
+        if key is None or key in self._idle:
+            self._pi.wave_delete(wid)
+        else:
+            self._idle[key] = wid
+
+    def start(self, wf, micros, key=None):
+        # Returns whether a wave was created
+        self.stop()
+
+        wid, created = self._wave(wf, key)
+        tick = self.ticks.now()
+        self._pi.wave_send_once(wid)
+        self._playing = (wid, tick, micros, key)
+        self.seen = tick
+        return created
+
+    def loop(self, wf, repeats, tail=None, head=None):
+        # Play head, wf repeats times and then tail, entirely from the DMA
+        # engine. Nothing else plays meanwhile and the waves are deleted
+        # together, so they are created at their own size rather than
+        # padded, or three would not fit.
+        self.stop()
+
+        chain = []
+        if head:
+            self._looped.append(self._create(head, pad=False))
+            chain.append(self._looped[-1])
+        wid = self._create(wf, pad=False)
+        self._looped.append(wid)
+        chain += repeat_chain([wid], repeats)
+        if tail:
+            self._looped.append(self._create(tail, pad=False))
+            chain.append(self._looped[-1])
+        micros = length(wf) * repeats + length(head or ()) + \
+            length(tail or ())
+        self._loop_span = (self.ticks.now(), micros)
+        self._pi.wave_chain(chain)
+
+    def queue(self, wf, micros, key=None):
+        if self._playing is None:
+            return self.start(wf, micros, key)
+
+        wid, created = self._wave(wf, key)
+        tick = self.ticks.now()
+        self._pi.wave_send_using_mode(wid, pigpio.WAVE_MODE_ONE_SHOT_SYNC)
+
+        # The DMA engine starts a synced wave the moment the previous one
+        # ends, unless it was queued too late to catch it
+        _, start, playing, _ = self._playing
+        end = start + playing
+        gap = max(tick - end, 0)
+        self._queued = (wid, end if not gap else tick, micros, key)
+
+        self.gaps.append(gap)
+        self._gap_ticks.observe(gap)
+        self.max_gap = max(self.max_gap, gap)
+        if gap:
+            logger.warning('Waveform queued {}us late'.format(gap))
+        return created
+
+    def advance(self):
+        # Retire the playing wave once transmission has moved past it
+        if self._looped:
+            if self.busy():
+                return False
+            self._delete_looped()
+            return True
+        if self._playing is None:
+            return False
+        if self._pi.wave_tx_at() == self._playing[0]:
+            return False
+
+        self.seen = self.ticks.now()
+        self._retire(self._playing[0], self._playing[3])
+        self._playing = self._queued
+        self._queued = None
+        self.handoffs += 1
+        return True
+
+    @property
+    def looping(self):
+        return bool(self._looped)
+
+    @property
+    def started(self):
+        # Tick the playing wave, or looped chain, started on
+        if self._looped:
+            return self._loop_span[0]
+        return self._playing[1] if self._playing is not None else None
+
+    def remaining(self):
+        # Micros until the playing wave, or looped chain, is due to end,
+        # or None if nothing is playing
+        if self._looped:
+            start, micros = self._loop_span
+        elif self._playing is not None:
+            _, start, micros, _ = self._playing
+        else:
+            return None
+        return max(start + micros - self.ticks.now(), 0)
+
+    def busy(self):
+        return bool(self._pi.wave_tx_busy())
+
+    def stop(self):
+        self._pi.wave_tx_stop()
+        for w in self._playing, self._queued:
+            if w is not None:
+                self._pi.wave_delete(w[0])
+        self._playing = None
+        self._queued = None
+        self._delete_looped()
+        while self._idle:
+            self._pi.wave_delete(self._idle.popitem()[1])
+
+    def _delete_looped(self):
+        for wid in self._looped:
+            self._pi.wave_delete(wid)
+        self._looped = []
+        self._loop_span = None
+
+    def gap_stats(self):
+        n = len(self.gaps)
+        return {'handoffs': self.handoffs,
+                'max': self.max_gap,
+                'mean': sum(self.gaps) / n if n else 0.0,
+                'last': self.gaps[-1] if n else None}
@@ -0,0 +1,256 @@
+import struct
+
+
+# Exceptions
+class ProtocolException(Exception):
+    pass
+
+
+# Framing
+# Every message is a frame: a big-endian u32 length, then a u32 request
+# id, a u8 Request/Response code, and the encoded payload. Responses carry
+# the id of the request they answer, so requests can be pipelined.
+LENGTH = struct.Struct('!I')
+HEADER = struct.Struct('!IB')
+MAX_FRAME = 1 << 26
+
+# Deepest nesting of lists and dicts a payload may have
+MAX_DEPTH = 32
+
+# Legacy clients send bare pickles, which start with the PROTO opcode
+PICKLE_PROTO = 0x80
+
+
+# Payload tags
+NONE = 0x4e
+TRUE = 0x54
+FALSE = 0x46
+SMALLINT = 0x63
+INT = 0x69
+BIGINT = 0x49
+FLOAT = 0x64
+SHORTSTR = 0x53
+STR = 0x73
+BYTES = 0x62
+LIST = 0x6c
+DICT = 0x6d
+
+_I8 = struct.Struct('!b')
+_I64 = struct.Struct('!q')
+_F64 = struct.Struct('!d')
+_U32 = struct.Struct('!I')
+
+
+# Encoding
+def _encode_int(obj, out):
+    if -128 <= obj < 128:
+        out.append(SMALLINT)
+        out += _I8.pack(obj)
+    elif -(1 << 63) <= obj < 1 << 63:
+        out.append(INT)
+        out += _I64.pack(obj)
+    else:
+        b = obj.to_bytes((obj.bit_length() + 8) // 8, 'big', signed=True)
+        out.append(BIGINT)
+        out += _U32.pack(len(b))
+        out += b
+
+
+def _encode_float(obj, out):
+    out.append(FLOAT)
+    out += _F64.pack(obj)
+
+
+def _encode_str(obj, out):
+    b = obj.encode('utf-8')
+    if len(b) < 256:
+        out.append(SHORTSTR)
+        out.append(len(b))
+    else:
+        out.append(STR)
+        out += _U32.pack(len(b))
+    out += b
+
+
+def _encode_bytes(obj, out):
+    out.append(BYTES)
+    out += _U32.pack(len(obj))
+    out += obj
+
+
+def _encode_list(obj, out):
+    out.append(LIST)
+    out += _U32.pack(len(obj))
+    for x in obj:
+        _encode(x, out)
+
+
+def _encode_dict(obj, out):
+    out.append(DICT)
+    out += _U32.pack(len(obj))
+    for k, v in obj.items():
+        _encode(k, out)
+        _encode(v, out)
+
+
+_ENCODERS = {
+    type(None): lambda obj, out: out.append(NONE),
+    bool: lambda obj, out: out.append(TRUE if obj else FALSE),
+    int: _encode_int,
+    float: _encode_float,
+    str: _encode_str,
+    bytes: _encode_bytes,
+    bytearray: _encode_bytes,
+    memoryview: _encode_bytes,
+    list: _encode_list,
+    tuple: _encode_list,
+    dict: _encode_dict,
+}
+
+
+def _encode(obj, out):
+    try:
+        fcn = _ENCODERS[type(obj)]
+    except KeyError:
+        # Subclasses (IntEnum) and numpy scalars
+        if isinstance(obj, bool):
+            fcn = _ENCODERS[bool]
+        elif hasattr(obj, '__index__'):
+            obj = obj.__index__()
+            fcn = _encode_int
+        elif hasattr(obj, '__float__'):
+            obj = float(obj)
+            fcn = _encode_float
+        else:
+            raise ProtocolException('Cannot encode {}'.format(type(obj)))
+    fcn(obj, out)
+
+
+def encode(obj):
+    out = bytearray()
+    _encode(obj, out)
+    return bytes(out)
+
+
+def _decode(b, idx, depth=0):
+    if depth > MAX_DEPTH:
+        raise ProtocolException('Payload nested too deeply')
+    tag = b[idx]
+    idx += 1
+    if tag == NONE:
+        return None, idx
+    elif tag == TRUE:
+        return True, idx
+    elif tag == FALSE:
+        return False, idx
+    elif tag == SMALLINT:
+        return _I8.unpack_from(b, idx)[0], idx + 1
+    elif tag == INT:
+        return _I64.unpack_from(b, idx)[0], idx + 8
+    elif tag == BIGINT:
+        n = _U32.unpack_from(b, idx)[0]
+        idx += 4
+        return int.from_bytes(b[idx:idx + n], 'big', signed=True), idx + n
+    elif tag == FLOAT:
+        return _F64.unpack_from(b, idx)[0], idx + 8
+    elif tag == SHORTSTR:
+        n = b[idx]
+        idx += 1
+        return str(b[idx:idx + n], 'utf-8'), idx + n
+    elif tag == STR:
+        n = _U32.unpack_from(b, idx)[0]
+        idx += 4
+        return str(b[idx:idx + n], 'utf-8'), idx + n
+    elif tag == BYTES:
+        n = _U32.unpack_from(b, idx)[0]
+        idx += 4
+        return bytes(b[idx:idx + n]), idx + n
+    elif tag == LIST:
+        n = _U32.unpack_from(b, idx)[0]
+        idx += 4
+        items = []
+        for _ in range(n):
+            x, idx = _decode(b, idx, depth + 1)
+            items.append(x)
+        return items, idx
+    elif tag == DICT:
+        n = _U32.unpack_from(b, idx)[0]
+        idx += 4
+        d = {}
+        for _ in range(n):
+            k, idx = _decode(b, idx, depth + 1)
+            d[k], idx = _decode(b, idx, depth + 1)
+        return d, idx
+    raise ProtocolException('Unknown payload tag {}'.format(tag))
+
+
+def decode(b):
+    try:
+        obj, idx = _decode(b, 0)
+    except (IndexError, struct.error) as e:
+        raise ProtocolException('Truncated payload') from e
+    except (TypeError, ValueError) as e:
+        # Invalid UTF-8, or an unhashable dict key
+        raise ProtocolException('Malformed payload: {}'.format(e)) from e
+    if idx > len(b):
+        raise ProtocolException('Truncated payload')
+    if idx != len(b):
+        raise ProtocolException('Trailing bytes after payload')
+    return obj
+
+
+# Messages
+def pack_message(rid, msg, data=None):
+    return pack_encoded(rid, msg, encode(data))
+
+
+def pack_encoded(rid, msg, payload):
+    # A message around an already encoded payload, so one payload can be
+    # framed for many recipients
+    body = HEADER.pack(rid, int(msg)) + payload
+    return LENGTH.pack(len(body)) + body
+
+
+def pack_bytes_header(rid, msg, n):
+    # Everything of a message with an n-byte bytes payload except the
+    # payload itself, so large payloads can be written without copying
+    head = HEADER.pack(rid, int(msg)) + bytes([BYTES]) + _U32.pack(n)
+    return LENGTH.pack(len(head) + n) + head
+
+
+def unpack_message(body):
+    if len(body) < HEADER.size:
+        raise ProtocolException('Frame too short')
+    rid, msg = HEADER.unpack_from(body)
+    return rid, msg, decode(bytes(body[HEADER.size:]))
+
+
+async def read_frame(reader, head=b''):
+    # Returns the body of the next frame, or None at end of stream
+    try:
+        head += await reader.readexactly(LENGTH.size - len(head))
+    except EOFError:
+        return None
+    n = LENGTH.unpack(head)[0]
+    if n > MAX_FRAME:
+        raise ProtocolException('Frame of {} bytes too large'.format(n))
+    return await reader.readexactly(n)
+
+
+def send_message(sock, rid, msg, data=None):
+    sock.sendall(pack_message(rid, msg, data))
+
+
+def _recv_exactly(sock, n):
+    buf = bytearray()
+    while len(buf) < n:
+        b = sock.recv(n - len(buf))
+        if not b:
+            raise EOFError('Connection closed')
+        buf += b
+    return buf
+
+
+def recv_message(sock):
+    n = LENGTH.unpack(_recv_exactly(sock, LENGTH.size))[0]
+    return unpack_message(_recv_exactly(sock, n))
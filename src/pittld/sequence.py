@@ -0,0 +1,585 @@
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import hashlib
+import math
+import multiprocessing
+from multiprocessing import shared_memory
+from threading import Lock
+
+import numpy as np
+
+
+# Logic levels
+ON = 0
+OFF = 1
+
+# Number of slots handled at a time when walking a sequence
+BLOCK = 1 << 20
+
+# Number of slots generated at a time by the random sampler
+GEN_BLOCK = 1 << 16
+
+# Sequences shorter than this are not worth handing to other processes,
+# and each worker gets about this many tasks so progress stays smooth
+PARALLEL_MIN = 1 << 24
+TASKS_PER_WORKER = 4
+
+# Longest unit of a regular sequence, in slots, short enough that the
+# unit always fits in one wave
+MAX_UNIT = 1 << 10
+
+
+# Lookup table for counting set bits a byte at a time
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+# Data structures
+class Sequence:
+    # Common interface of binary sequences of logic levels. Subclasses
+    # provide __len__ and _slice, which returns a BitSequence.
+
+    def __getitem__(self, key):
+        n = len(self)
+        if isinstance(key, slice):
+            start, stop, step = key.indices(n)
+            if step != 1:
+                raise ValueError('Sequence slices must be contiguous')
+            return self._slice(start, max(start, stop))
+
+        idx = key + n if key < 0 else key
+        if not 0 <= idx < n:
+            raise IndexError('Sequence index out of range')
+        return self._slice(idx, idx + 1)[0]
+
+    def __iter__(self):
+        for _, block in self.blocks():
+            yield from block.unpack().tolist()
+
+    def blocks(self, size=BLOCK):
+        n = len(self)
+        for start in range(0, n, size):
+            yield start, self._slice(start, min(start + size, n))
+
+    def unpack(self):
+        return self._slice(0, len(self)).unpack()
+
+    def tolist(self):
+        return list(self)
+
+
+class BitSequence(Sequence):
+    # A binary sequence of logic levels stored one bit per slot.
+    # Slices starting on a byte boundary are views into the same buffer,
+    # so chunking a sequence does not copy it.
+
+    def __init__(self, bits, n):
+        self._bits = np.asarray(bits, dtype=np.uint8)
+        self._n = int(n)
+        if self._n < 0 or self._n > 8 * len(self._bits):
+            raise ValueError('Sequence length does not fit its buffer')
+
+    @classmethod
+    def from_levels(cls, levels):
+        levels = np.asarray(levels, dtype=np.uint8)
+        return cls(np.packbits(levels), len(levels))
+
+    @classmethod
+    def full(cls, n, level):
+        fill = 0xff if level else 0x00
+        return cls(np.full((n + 7) // 8, fill, dtype=np.uint8), n)
+
+    @property
+    def nbytes(self):
+        return (self._n + 7) // 8
+
+    def __len__(self):
+        return self._n
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return super().__getitem__(key)
+
+        idx = key + self._n if key < 0 else key
+        if not 0 <= idx < self._n:
+            raise IndexError('Sequence index out of range')
+        return int(self._bits[idx >> 3] >> (7 - (idx & 7))) & 1
+
+    def _slice(self, start, stop):
+        lo = start >> 3
+        hi = (stop + 7) >> 3
+        if start & 7 == 0:
+            return BitSequence(self._bits[lo:hi], stop - start)
+
+        shift = start & 7
+        levels = np.unpackbits(self._bits[lo:hi])
+        return BitSequence.from_levels(levels[shift:shift + stop - start])
+
+    def unpack(self):
+        return np.unpackbits(self._bits, count=self._n)
+
+    def packed(self):
+        # The packed bytes, zero-copy unless the last byte needs its
+        # padding bits cleared
+        bits = self._bits[:self.nbytes]
+        if self._n & 7:
+            bits = bits.copy()
+            bits[-1] &= (0xff << (8 - (self._n & 7))) & 0xff
+        return bits
+
+    def count(self, level=OFF):
+        full = self._n >> 3
+        ones = int(_POPCOUNT[self._bits[:full]].sum(dtype=np.int64))
+        if self._n & 7:
+            ones += int(np.unpackbits(self._bits[full:full + 1],
+                                      count=self._n & 7).sum())
+        return ones if level else self._n - ones
+
+    def __repr__(self):
+        return 'BitSequence(n={}, on={})'.format(self._n, self.count(ON))
+
+
+class Chain:
+    # The sub-sequences a program is played as, described by their
+    # boundaries rather than stored, so a chunk is only sliced out of the
+    # sequence when it is needed.
+
+    def __init__(self, seq, bounds):
+        self.seq = seq
+        self.bounds = bounds
+
+    def __len__(self):
+        return len(self.bounds) - 1
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError('Chain index out of range')
+        return self.seq[int(self.bounds[idx]):int(self.bounds[idx + 1])]
+
+    def span(self, idx):
+        return int(self.bounds[idx + 1] - self.bounds[idx])
+
+
+class SeededSequence(Sequence):
+    # A uniformly random m-of-n sequence that is never stored. Only the
+    # per-block ON counts are kept; blocks are regenerated from the seed
+    # whenever a slice touches them, and the last few are cached.
+
+    def __init__(self, n, m, seed, cache=2):
+        self.n = int(n)
+        self.m = int(m)
+        self.seed = seed
+        self._counts = on_counts(self.n, self.m, seed)
+        self._cache = OrderedDict()
+        self._cache_len = cache
+        self._cache_lock = Lock()
+
+    def __len__(self):
+        return self.n
+
+    def _block(self, idx):
+        with self._cache_lock:
+            if idx in self._cache:
+                self._cache.move_to_end(idx)
+                return self._cache[idx]
+
+        size = min(GEN_BLOCK, self.n - idx * GEN_BLOCK)
+        levels = random_block(size, self._counts[idx], self.seed, idx)
+        block = BitSequence.from_levels(levels)
+
+        with self._cache_lock:
+            self._cache[idx] = block
+            while len(self._cache) > self._cache_len:
+                self._cache.popitem(last=False)
+        return block
+
+    def _slice(self, start, stop):
+        lo = start // GEN_BLOCK
+        hi = (stop + GEN_BLOCK - 1) // GEN_BLOCK
+        if hi - lo == 1:
+            offset = lo * GEN_BLOCK
+            return self._block(lo)[start - offset:stop - offset]
+
+        levels = np.concatenate([self._block(i).unpack()
+                                 for i in range(lo, hi)])
+        offset = lo * GEN_BLOCK
+        return BitSequence.from_levels(levels[start - offset:stop - offset])
+
+    def count(self, level=OFF):
+        return self.n - self.m if level else self.m
+
+    def __repr__(self):
+        return 'SeededSequence(n={}, on={}, seed={})'.format(self.n, self.m,
+                                                           self.seed)
+
+
+class PeriodicSequence(Sequence):
+    # A unit sequence repeated a number of times and padded with tail
+    # slots up to n. Only the unit is stored.
+
+    def __init__(self, unit, repeats, n, tail=OFF):
+        self.unit = unit
+        self.repeats = int(repeats)
+        self.n = int(n)
+        self.tail = tail
+        if self.n < self.repeats * len(unit):
+            raise ValueError('Sequence length does not fit its periods')
+        self._levels = unit.unpack()
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def body(self):
+        return self.repeats * len(self.unit)
+
+    def _slice(self, start, stop):
+        levels = np.full(stop - start, self.tail, dtype=np.uint8)
+        hi = min(stop, self.body)
+        if start < hi:
+            idx = np.arange(start, hi) % len(self.unit)
+            levels[:hi - start] = self._levels[idx]
+        return BitSequence.from_levels(levels)
+
+    def count(self, level=OFF):
+        on = self.repeats * self.unit.count(ON)
+        if self.tail == ON:
+            on += self.n - self.body
+        return self.n - on if level else on
+
+    def __repr__(self):
+        fstr = 'PeriodicSequence(n={}, unit={}, repeats={})'
+        return fstr.format(self.n, len(self.unit), self.repeats)
+
+
+class RegularSequence(Sequence):
+    # m ON slots spread evenly over n, the i-th on slot i * n // m, so
+    # periods between them are n // m or n // m + 1 slots long. Nothing
+    # is stored; slices are computed from n and m.
+
+    def __init__(self, n, m):
+        self.n = int(n)
+        self.m = int(m)
+        if not 0 <= self.m <= self.n:
+            raise ValueError('Exposure of {} slots out of '
+                             '{}'.format(self.m, self.n))
+
+    def __len__(self):
+        return self.n
+
+    def _slice(self, start, stop):
+        # ON slots i * n // m with start <= i * n // m < stop, that is
+        # start * m <= i * n < stop * m
+        n, m = self.n, self.m
+        lo = -(-start * m // n)
+        hi = -(-stop * m // n)
+        levels = np.full(stop - start, OFF, dtype=np.uint8)
+        if lo < hi:
+            idx = np.arange(lo, hi, dtype=np.int64)
+            levels[idx * n // m - start] = ON
+        return BitSequence.from_levels(levels)
+
+    def count(self, level=OFF):
+        return self.n - self.m if level else self.m
+
+    def __repr__(self):
+        return 'RegularSequence(n={}, on={})'.format(self.n, self.m)
+
+
+class MergedSequence(Sequence):
+    # Several sequences on a common slot grid, read as one sequence whose
+    # level in a slot has bit i set when sequence i is OFF there. Runs of
+    # equal merged levels are the runs of all the sequences at once.
+    # Sequences shorter than the longest are padded with OFF.
+
+    def __init__(self, seqs):
+        self.seqs = list(seqs)
+        if not 0 < len(self.seqs) <= 32:
+            raise ValueError('Between 1 and 32 sequences can be merged')
+        self.n = max(len(seq) for seq in self.seqs)
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return super().__getitem__(key)
+
+        idx = key + self.n if key < 0 else key
+        if not 0 <= idx < self.n:
+            raise IndexError('Sequence index out of range')
+        return int(self._slice(idx, idx + 1).unpack()[0])
+
+    def _slice(self, start, stop):
+        seqs = []
+        for seq in self.seqs:
+            hi = min(stop, len(seq))
+            part = seq[start:hi] if start < hi else BitSequence.full(0, OFF)
+            pad = stop - start - len(part)
+            if pad:
+                levels = np.concatenate((part.unpack(),
+                                         np.full(pad, OFF, dtype=np.uint8)))
+                part = BitSequence.from_levels(levels)
+            seqs.append(part)
+        return MergedSequence(seqs)
+
+    def unpack(self):
+        levels = np.zeros(self.n, dtype=np.uint32)
+        for i, seq in enumerate(self.seqs):
+            levels[:len(seq)] |= seq.unpack().astype(np.uint32) << i
+            levels[len(seq):] |= OFF << i
+        return levels
+
+    def __repr__(self):
+        return 'MergedSequence(n={}, seqs={})'.format(self.n, len(self.seqs))
+
+
+# Run scanning
+def runs(seq, max_len=None):
+    # Walks seq block by block, yielding the end of each block along with
+    # the start and level of every run of equal slots beginning in it.
+    # Runs longer than max_len are broken into several runs.
+    prev = None
+    run_start = 0
+    for offset, block in seq.blocks():
+        levels = block.unpack()
+        stop = offset + len(levels)
+
+        starts = np.flatnonzero(levels[1:] != levels[:-1]) + 1 + offset
+        if prev is None or levels[0] != prev:
+            starts = np.concatenate(([offset], starts))
+            spans = starts
+        else:
+            spans = np.concatenate(([run_start], starts))
+
+        if max_len is not None:
+            ends = np.append(spans[1:], stop)
+            long = np.flatnonzero(ends - spans > max_len)
+            if len(long):
+                breaks = np.concatenate([np.arange(spans[i] + max_len,
+                                                   ends[i], max_len)
+                                         for i in long])
+                breaks = breaks[breaks >= offset]
+                starts = np.sort(np.concatenate((starts, breaks)))
+
+        yield stop, starts, levels[starts - offset]
+
+        prev = levels[-1]
+        run_start = spans[-1]
+
+
+def _digest(n):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(n.to_bytes(8, 'big'))
+    return h
+
+
+def digest(seq):
+    # The content digest summarize gives, without the rest
+    h = _digest(len(seq))
+    for _, block in seq.blocks():
+        h.update(block.packed())
+    return h.hexdigest()
+
+
+def summarize(seq, progress=None):
+    # ON count, run count, longest runs of either level and a content
+    # digest, in one pass over seq. progress is called with the fraction
+    # done after every block.
+    h = _digest(len(seq))
+
+    on = 0
+    nruns = 0
+    longest = {ON: 0, OFF: 0}
+    run_start = None
+    run_level = None
+    for offset, block in seq.blocks():
+        h.update(block.packed())
+        levels = block.unpack()
+        on += len(levels) - int(levels.sum())
+
+        starts = np.flatnonzero(levels[1:] != levels[:-1]) + 1 + offset
+        if run_level is None or levels[0] != run_level:
+            starts = np.concatenate(([offset], starts))
+        nruns += len(starts)
+
+        # Runs that end in this block
+        if run_start is None:
+            points = starts
+            prior = levels[starts - offset]
+        else:
+            points = np.concatenate(([run_start], starts))
+            prior = np.concatenate(([run_level], levels[starts - offset]))
+        lengths = np.diff(points)
+        for level in ON, OFF:
+            ended = lengths[prior[:-1] == level]
+            if len(ended):
+                longest[level] = max(longest[level], int(ended.max()))
+
+        run_start = int(points[-1])
+        run_level = int(prior[-1])
+        if progress is not None:
+            progress((offset + len(levels)) / len(seq))
+
+    if run_start is not None:
+        longest[run_level] = max(longest[run_level], len(seq) - run_start)
+
+    return {'length': len(seq),
+            'on': on,
+            'runs': nruns,
+            'longest_on': longest[ON],
+            'longest_off': longest[OFF],
+            'hash': h.hexdigest()}
+
+
+# Generation
+def regular_sequence(n, m):
+    # Exactly m ON slots spread evenly over n. The spacing repeats every
+    # n / gcd(n, m) slots, so where that unit is short enough the
+    # sequence is the unit repeated throughout, which can be looped;
+    # otherwise it is computed slice by slice.
+    n, m = int(n), int(m)
+    if not 0 <= m <= n:
+        raise ValueError('Exposure of {} slots out of {}'.format(m, n))
+    if m in (0, n):
+        return PeriodicSequence(BitSequence.full(1, OFF), 0, n,
+                                ON if m else OFF)
+
+    g = math.gcd(n, m)
+    if n // g <= MAX_UNIT:
+        unit = RegularSequence(n // g, m // g)
+        return PeriodicSequence(BitSequence.from_levels(unit.unpack()), g, n)
+    return RegularSequence(n, m)
+
+
+def new_seed():
+    return np.random.SeedSequence().entropy
+
+
+def block_sizes(n, block=GEN_BLOCK):
+    sizes = np.full(n // block, block, dtype=np.int64)
+    if n % block:
+        sizes = np.append(sizes, n % block)
+    return sizes
+
+
+def on_counts(n, m, seed, block=GEN_BLOCK):
+    # How many of the m ON slots land in each block of a uniformly random
+    # m-of-n sequence; the joint law is multivariate hypergeometric
+    rng = np.random.default_rng(np.random.SeedSequence(seed))
+    return rng.multivariate_hypergeometric(block_sizes(n, block), m)
+
+
+def random_block(size, k, seed, idx):
+    # Uniformly random arrangement of k ON slots among size slots. Each
+    # block draws from its own stream, so it can be regenerated on its own.
+    ss = np.random.SeedSequence(seed, spawn_key=(idx,))
+    rng = np.random.default_rng(ss)
+
+    if 2 * k <= size:
+        minority, majority, j = ON, OFF, k
+    else:
+        minority, majority, j = OFF, ON, size - k
+
+    levels = np.full(size, majority, dtype=np.uint8)
+    levels[rng.choice(size, j, replace=False, shuffle=False)] = minority
+    return levels
+
+
+def fill_blocks(bits, seed, lo, sizes, counts, progress=None):
+    # Write generator blocks lo, lo + 1, ... packed into bits
+    for idx, (size, k) in enumerate(zip(sizes, counts), lo):
+        start = idx * (GEN_BLOCK >> 3)
+        packed = np.packbits(random_block(size, k, seed, idx))
+        bits[start:start + len(packed)] = packed
+        if progress is not None:
+            progress(idx - lo + 1)
+
+
+def random_sequence(n, m, seed=None, progress=None, workers=1, out=None):
+    # Blocks are independent given their ON counts, so they are generated
+    # in other processes when there are several workers; the sequence is
+    # the same for a given seed either way. The packed bits are written
+    # to out if given, e.g. a memory-mapped file.
+    if seed is None:
+        seed = new_seed()
+
+    sizes = block_sizes(n)
+    counts = on_counts(n, m, seed)
+    bits = np.empty((n + 7) // 8, dtype=np.uint8) if out is None else out
+    if workers > 1 and n >= PARALLEL_MIN:
+        _parallel_blocks(bits, n, seed, sizes, counts, progress, workers)
+    else:
+        step = None
+        if progress is not None:
+            def step(done):
+                progress(done / len(sizes))
+        fill_blocks(bits, seed, 0, sizes, counts, step)
+
+    return BitSequence(bits, n)
+
+
+# Parallel generation
+_pools = {}
+
+
+def _pool(workers):
+    # Pools are kept between calls. Workers are forked from a server
+    # process rather than from the caller, which has threads running.
+    if workers not in _pools:
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            ctx = multiprocessing.get_context('forkserver')
+        else:
+            ctx = multiprocessing.get_context('spawn')
+        _pools[workers] = ProcessPoolExecutor(workers, mp_context=ctx)
+    return _pools[workers]
+
+
+def _shared_blocks(name, n, seed, lo, sizes, counts):
+    # Runs in a worker: fill blocks straight into the caller's buffer
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        bits = np.ndarray((n + 7) // 8, dtype=np.uint8, buffer=shm.buf)
+        fill_blocks(bits, seed, lo, sizes, counts)
+        del bits
+    finally:
+        shm.close()
+    return len(sizes)
+
+
+def _parallel_blocks(bits, n, seed, sizes, counts, progress, workers):
+    nbytes = (n + 7) // 8
+    ntasks = workers * TASKS_PER_WORKER
+    edges = np.linspace(0, len(sizes), ntasks + 1).astype(np.int64)
+
+    shm = shared_memory.SharedMemory(create=True, size=nbytes)
+    futures = []
+    try:
+        pool = _pool(workers)
+        for lo, hi in zip(edges[:-1].tolist(), edges[1:].tolist()):
+            if lo < hi:
+                futures.append(pool.submit(_shared_blocks, shm.name, n, seed,
+                                           lo, sizes[lo:hi], counts[lo:hi]))
+        done = 0
+        for future in as_completed(futures):
+            done += future.result()
+            if progress is not None:
+                progress(done / len(sizes))
+
+        # One copy out, so the segment can be released right away
+        view = np.ndarray(nbytes, dtype=np.uint8, buffer=shm.buf)
+        bits[:] = view
+        del view
+    finally:
+        for future in futures:
+            future.cancel()
+        # Workers still running write into the segment until they finish
+        for future in futures:
+            if not future.cancelled():
+                try:
+                    future.result()
+                except Exception:
+                    pass
+        shm.close()
+        shm.unlink()
@@ -21,9 +21,47 @@ class Request(IntEnum):
     Q_SEQ = 7
     QUERY_PROGRAM = 8
     Q_PROG = 8
+    STAGE_SEQUENCE_SEEDED = 9
+    STG_SEQ_SEED = 9
+    QUERY_RANGE = 10
+    Q_RANGE = 10
+    QUERY_CHUNK = 11
+    Q_CHUNK = 11
+    QUERY_SUMMARY = 12
+    Q_SUM = 12
+    SUBSCRIBE = 13
+    SUB = 13
+    UNSUBSCRIBE = 14
+    UNSUB = 14
+    STAGE_JOB = 15
+    STG_JOB = 15
+    QUERY_JOB = 16
+    Q_JOB = 16
+    CANCEL_JOB = 17
+    CANCEL = 17
+    RESUME_SEQUENCE = 18
+    RESUME = 18
+    ENQUEUE = 19
+    ENQ = 19
+    QUERY_QUEUE = 20
+    Q_QUEUE = 20
+    DEQUEUE = 21
+    DEQ = 21
+    MOVE_QUEUE = 22
+    MOVE = 22
+    STAGE_CHANNEL = 23
+    STG_CHAN = 23
+    CLEAR_CHANNEL = 24
+    CLR_CHAN = 24
+    QUERY_CHANNELS = 25
+    Q_CHAN = 25
+    QUERY_METRICS = 26
+    Q_METRICS = 26
 
 
 class Response(IntEnum):
     SUCCESS = 1
     FAILURE = 2
     STREAM = 3
+    UNCHANGED = 4
+    EVENT = 5
@@ -0,0 +1,154 @@
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from pittld import logger
+from pittld.sequence import BitSequence
+
+
+# Programs kept in a store
+STAGED = 'staged'
+COMMITTED = 'committed'
+
+
+# Store
+class Store:
+    # Staged and committed programs kept in a directory, so they outlive
+    # the daemon. A program is described by a small JSON file (timing
+    # parameters, how to rebuild its sequence, its stats). Sequences that
+    # cannot be rebuilt from a seed live in files of packed bits, which
+    # are memory-mapped rather than read so the page cache decides how
+    # much of them is resident. Description files are replaced atomically,
+    # bit files are on disk before any description refers to them, and
+    # they are only deleted once no description does.
+
+    def __init__(self, path):
+        self.path = path
+        # Buffers of allocated files no description refers to yet, and
+        # how many programs queued or playing hold each file
+        self._pending = {}
+        self._held = {}
+        os.makedirs(path, exist_ok=True)
+        self._collect()
+
+    def _meta_path(self, name):
+        return os.path.join(self.path, name + '.json')
+
+    def _bounds_path(self, name):
+        return os.path.join(self.path, name + '.chain.npy')
+
+    def allocate(self, n):
+        # (file name, writable buffer) for the packed bits of n slots
+        fd, path = tempfile.mkstemp(prefix='seq-', suffix='.bits',
+                                    dir=self.path)
+        nbytes = (n + 7) // 8
+        with os.fdopen(fd, 'wb') as f:
+            f.truncate(nbytes)
+        name = os.path.basename(path)
+        if not nbytes:
+            buf = np.empty(0, dtype=np.uint8)
+        else:
+            buf = np.memmap(path, dtype=np.uint8, mode='r+')
+        self._pending[name] = buf
+        return name, buf
+
+    def discard(self, name):
+        # Drop an allocated file that never made it into a program
+        self._pending.pop(name, None)
+        try:
+            os.remove(os.path.join(self.path, name))
+        except FileNotFoundError:
+            pass
+
+    def hold(self, name):
+        # Keep a file while a program that is not described needs it
+        self._held[name] = self._held.get(name, 0) + 1
+
+    def release(self, name):
+        n = self._held.pop(name, 0) - 1
+        if n > 0:
+            self._held[name] = n
+        else:
+            self._collect()
+
+    def open_bits(self, name, n):
+        path = os.path.join(self.path, name)
+        if not n:
+            return BitSequence(np.empty(0, dtype=np.uint8), 0)
+        return BitSequence(np.memmap(path, dtype=np.uint8, mode='r'), n)
+
+    def _sync(self, name):
+        # Write an allocated file's bits through to disk, along with its
+        # directory entry, so no description outlives what it refers to
+        buf = self._pending.pop(name)
+        if isinstance(buf, np.memmap):
+            buf.flush()
+        for path, flags in ((os.path.join(self.path, name), os.O_RDONLY),
+                            (self.path, os.O_RDONLY | os.O_DIRECTORY)):
+            fd = os.open(path, flags)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def save(self, name, meta):
+        if isinstance(meta.get('sequence'), dict):
+            file = meta['sequence'].get('file')
+            if file in self._pending:
+                self._sync(file)
+        tmp = self._meta_path(name) + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._meta_path(name))
+        self._collect()
+
+    def load(self, name):
+        try:
+            with open(self._meta_path(name)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.error('Could not load {} program: {}'.format(name, e))
+            return None
+
+    def save_bounds(self, name, bounds):
+        # The chunk boundaries a program was split at
+        tmp = self._bounds_path(name) + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.save(f, np.asarray(bounds, dtype=np.int64))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._bounds_path(name))
+
+    def load_bounds(self, name):
+        try:
+            return np.load(self._bounds_path(name), mmap_mode='r')
+        except (OSError, ValueError):
+            return None
+
+    def clear(self, name):
+        for path in self._meta_path(name), self._bounds_path(name):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._collect()
+
+    def _collect(self):
+        # Delete bit files no program or staging in progress refers to
+        used = set(self._pending) | set(self._held)
+        for name in STAGED, COMMITTED:
+            meta = self.load(name)
+            if meta and meta.get('sequence'):
+                used.add(meta['sequence'].get('file'))
+
+        for f in os.listdir(self.path):
+            stale = f.endswith('.tmp') or \
+                (f.endswith('.bits') and f not in used)
+            if stale:
+                os.remove(os.path.join(self.path, f))
@@ -0,0 +1,6 @@
+import os
+import sys
+
+
+# Run against the sources in the tree rather than an installed copy
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'src'))
@@ -0,0 +1,187 @@
+import os
+
+import numpy as np
+import pytest
+
+from pittld.backend import SimulatedPi
+from pittld.driver import DriverException, Service
+from pittld.store import COMMITTED
+
+
+def advance(driver, steps):
+    with driver._cond:
+        for _ in range(steps):
+            t = driver._advance()
+            driver.pi.clock.advance(min(t, 60) if t else 0.5)
+
+
+@pytest.fixture
+def interrupted(tmp_path):
+    # A random program checkpointed by a driver that then went away, and
+    # a fresh driver on the same store and clock
+    pi = SimulatedPi()
+    driver = Service(None, pi)
+    driver.attach_store(str(tmp_path))
+    driver.stage_timing((600, 0.3, 0.01))
+    driver.stage_seq_rand(1)
+    driver.start_seq()
+    advance(driver, 5)
+    driver._checkpoint(force=True)
+    driver._player.stop()
+
+    restarted = Service(None, SimulatedPi(clock=pi.clock))
+    restarted.attach_store(str(tmp_path))
+    pi.clock.advance(10)
+    return restarted, tmp_path
+
+
+def bits_file(driver):
+    return driver.store.load(COMMITTED)['sequence']['file']
+
+
+def test_resume(interrupted):
+    driver, _ = interrupted
+    driver.resume_seq()
+    assert driver.started is not None
+
+
+def test_resume_missing_bits(interrupted):
+    driver, path = interrupted
+    os.remove(path / bits_file(driver))
+    with pytest.raises(DriverException):
+        driver.resume_seq()
+    assert driver.started is None
+    assert driver.resumable() is not None
+
+
+def test_resume_corrupt_bits(interrupted):
+    driver, path = interrupted
+    bits = np.memmap(path / bits_file(driver), dtype=np.uint8, mode='r+')
+    bits[:] = 0
+    bits.flush()
+    del bits
+    with pytest.raises(DriverException):
+        driver.resume_seq()
+    assert driver.started is None
+
+
+def test_queued_program_keeps_bits(tmp_path):
+    pi = SimulatedPi()
+    driver = Service(None, pi)
+    driver.attach_store(str(tmp_path))
+    driver.stage_timing((600, 0.3, 0.01))
+    driver.stage_seq_rand(1)
+    queued = driver.enqueue()
+    driver.stage_seq_rand(2)
+    assert queued.ref['file'] in os.listdir(tmp_path)
+
+    # Nothing plays, so the queued program starts at once
+    advance(driver, 2)
+    assert driver.committed_stats is queued.stats
+    driver._checkpoint(force=True)
+    driver._player.stop()
+
+    restarted = Service(None, SimulatedPi(clock=pi.clock))
+    restarted.attach_store(str(tmp_path))
+    pi.clock.advance(10)
+    restarted.resume_seq()
+    assert restarted.committed_stats['hash'] == queued.stats['hash']
+
+
+def test_dequeued_program_drops_bits(tmp_path):
+    driver = Service(None, SimulatedPi())
+    driver.attach_store(str(tmp_path))
+    driver.stage_timing((600, 0.3, 0.01))
+    driver.stage_seq_rand(1)
+    queued = driver.enqueue()
+    driver.stage_seq_rand(2)
+    driver.dequeue(queued.id)
+    assert queued.ref['file'] not in os.listdir(tmp_path)
+
+
+@pytest.fixture
+def staged_next():
+    # A program playing its last chunk, with a queued one staged behind it
+    pi = SimulatedPi()
+    driver = Service(None, pi)
+    driver.stage_timing((20, 0.4, 0.001))
+    driver.stage_seq_rand(1)
+    driver.start_seq()
+    driver.stage_timing((5, 0.5, 0.001))
+    driver.stage_seq_rand(2)
+    queued = driver.enqueue()
+    with driver._cond:
+        while driver._next is None:
+            t = driver._advance()
+            pi.clock.advance(min(t, 0.3) if t else 0.01)
+    return driver, queued
+
+
+def test_staged_program_cannot_be_taken_back(staged_next):
+    driver, queued = staged_next
+    driver.stage_timing((1, 0.5, 0.001))
+    driver.stage_seq_rand(3)
+    later = driver.enqueue()
+    sent = len(driver.pi.transmissions)
+
+    assert [p.id for p in driver.queued] == [queued.id, later.id]
+    with pytest.raises(DriverException):
+        driver.dequeue(queued.id)
+    with pytest.raises(DriverException):
+        driver.move(queued.id, 1)
+    with pytest.raises(DriverException):
+        driver.move(later.id, 0)
+    driver.move(queued.id, 0)
+    driver.dequeue()
+
+    assert [p.id for p in driver.queued] == [queued.id]
+    assert len(driver.pi.transmissions) == sent
+
+
+def test_move():
+    driver = Service(None, SimulatedPi())
+    driver.stage_timing((10, 0.5, 0.01))
+    driver.stage_seq_rand(1)
+    a, b, c = driver.enqueue(), driver.enqueue(), driver.enqueue()
+    driver.move(c.id, 0)
+    assert driver.queue == [c, a, b]
+    driver.move(c.id, -1)
+    assert driver.queue == [a, c, b]
+    driver.move(a.id, 10)
+    assert driver.queue == [c, b, a]
+    with pytest.raises(DriverException):
+        driver.move(a.id, 'x')
+    assert driver.queue == [c, b, a]
+
+
+def test_channel_pins():
+    driver = Service(None, SimulatedPi())
+    driver.stage_timing((10, 0.5, 0.01))
+    driver.stage_seq_rand(1)
+    for pin in 14, 15, 24, 32, 'x':
+        with pytest.raises(DriverException):
+            driver.stage_channel(pin)
+    driver.stage_channel('19')
+    assert list(driver.staged_channels) == [19]
+    driver.clear_channel('19')
+    assert driver.staged_channels == {}
+    with pytest.raises(DriverException):
+        driver.clear_channel(19)
+
+
+def test_drift_measured_from_seen_handoffs():
+    pi = SimulatedPi()
+    driver = Service(None, pi)
+    driver.max_micros = 1000000
+    driver.stage_timing((10, 0.5, 0.01))
+    driver.stage_seq_rand(1)
+    driver.start_seq()
+    with driver._cond:
+        driver._advance()
+        # The run loop sees the handoff 5ms after it happened
+        pi.clock.advance(driver._player.remaining() / 1e6 + 0.005)
+        driver._advance()
+    stats = driver.drift_stats()
+    assert stats['chunks'] == 1
+    assert stats['measured'] - stats['scheduled'] >= 5000
+    assert stats['drift'] >= 5000
@@ -0,0 +1,67 @@
+import socket
+import time
+
+import pytest
+
+import pittld.driver
+import pittld.manager
+from pittld import protocol
+from pittld.backend import SimulatedPi
+from pittld.protocol import ProtocolException, decode, encode
+from pittld.shared import Request, Response
+
+
+def test_round_trip():
+    obj = [None, True, -1, 1 << 40, 1 << 70, 0.5, 'x', 'y' * 300, b'z',
+           {'a': [1, 2]}]
+    assert decode(encode(obj)) == obj
+
+
+MALFORMED = {
+    'unknown tag': b'\x00',
+    'truncated': bytes([protocol.INT, 0, 0]),
+    'short string overrun': bytes([protocol.SHORTSTR, 5]) + b'ab',
+    'trailing': encode(1) + b'\x00',
+    'invalid utf-8': bytes([protocol.SHORTSTR, 2]) + b'\xff\xfe',
+    'unhashable key': bytes([protocol.DICT, 0, 0, 0, 1]) + encode([]) +
+    encode(1),
+    'deep nesting': bytes([protocol.LIST, 0, 0, 0, 1]) * 10000 +
+    encode(None),
+}
+
+
+@pytest.mark.parametrize('payload', MALFORMED.values(), ids=list(MALFORMED))
+def test_malformed_payloads(payload):
+    with pytest.raises(ProtocolException):
+        decode(payload)
+
+
+def test_nesting_up_to_limit():
+    obj = None
+    for _ in range(protocol.MAX_DEPTH):
+        obj = [obj]
+    assert decode(encode(obj)) == obj
+
+
+@pytest.fixture
+def address():
+    driver = pittld.driver.Service(None, SimulatedPi())
+    svc = pittld.manager.Service(driver, host='127.0.0.1', port=0)
+    svc.daemon = True
+    svc.start()
+    while svc.address is None:
+        time.sleep(0.01)
+    return svc.address
+
+
+@pytest.mark.parametrize('payload', MALFORMED.values(), ids=list(MALFORMED))
+def test_malformed_frames_answered(address, payload):
+    with socket.create_connection(address) as sock:
+        body = protocol.HEADER.pack(1, Request.QUERY_TIMING) + payload
+        sock.sendall(protocol.LENGTH.pack(len(body)) + body)
+        assert protocol.recv_message(sock)[1] == Response.FAILURE
+
+        # The connection is still served
+        protocol.send_message(sock, 2, Request.QUERY_TIMING)
+        rid, msg, _ = protocol.recv_message(sock)
+        assert (rid, msg) == (2, Response.SUCCESS)
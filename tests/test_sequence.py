@@ -0,0 +1,37 @@
+import numpy as np
+
+from pittld.sequence import (MAX_UNIT, ON, PeriodicSequence, RegularSequence,
+                             regular_sequence, summarize)
+
+
+def test_regular_short_unit_is_periodic():
+    seq = regular_sequence(86400, 25920)
+    assert isinstance(seq, PeriodicSequence)
+    assert len(seq.unit) <= MAX_UNIT
+    assert seq.body == len(seq)
+    assert seq.count(ON) == 25920
+
+
+def test_regular_coprime_has_no_tail():
+    # 1000003 is prime, so the spacing only repeats over the whole program
+    n, m = 1000003, 300001
+    seq = regular_sequence(n, m)
+    assert isinstance(seq, RegularSequence)
+
+    levels = seq.unpack()
+    on = np.flatnonzero(levels == ON)
+    assert len(levels) == n
+    assert len(on) == m
+    gaps = np.diff(np.append(on, n + on[0]))
+    assert set(gaps.tolist()) <= {n // m, n // m + 1}
+
+    stats = summarize(seq)
+    assert stats['on'] == m
+    assert stats['longest_off'] <= n // m
+
+
+def test_regular_slices_match_whole():
+    seq = RegularSequence(86401, 25920)
+    levels = seq.unpack()
+    for start, stop in (0, 1), (5, 17), (1000, 86401), (86400, 86401):
+        assert (seq[start:stop].unpack() == levels[start:stop]).all()
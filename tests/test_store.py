@@ -0,0 +1,34 @@
+import os
+
+import numpy as np
+
+from pittld.store import STAGED, Store
+
+
+def test_bits_synced_before_description(tmp_path, monkeypatch):
+    store = Store(str(tmp_path))
+    name, buf = store.allocate(64)
+    buf[:] = 0xa5
+
+    synced = []
+    fsync = os.fsync
+
+    def record(fd):
+        synced.append(os.path.basename(os.readlink('/proc/self/fd/{}'
+                                                   .format(fd))))
+        fsync(fd)
+    monkeypatch.setattr(os, 'fsync', record)
+
+    store.save(STAGED, {'sequence': {'file': name}})
+    assert synced.index(name) < synced.index(STAGED + '.json.tmp')
+    assert np.fromfile(tmp_path / name, dtype=np.uint8).tolist() == \
+        [0xa5] * 8
+
+
+def test_unreferenced_bits_collected(tmp_path):
+    store = Store(str(tmp_path))
+    kept, _ = store.allocate(8)
+    dropped, _ = store.allocate(8)
+    store.save(STAGED, {'sequence': {'file': kept}})
+    store.discard(dropped)
+    assert sorted(os.listdir(tmp_path)) == sorted([kept, STAGED + '.json'])